@@ -0,0 +1,73 @@
+"""
+Throughput of micro-batch ingestion against serving events one by one.
+The same synthetic events are served per event with new_event_data, as the stream
+does without --batch, and through ingest_batch in batches of several sizes.
+Reports events per second and checks that all paths give the same results.
+
+Run from the repository root:
+    python -m benchmarks.ingest_batch --desks 100 --hours 48
+
+"""
+
+# packages
+import time
+import argparse
+
+# project
+from benchmarks.synthetic import make_devices, make_events
+from occupancy.engine     import Engine
+
+
+def per_event(devices, events):
+    """
+    Serve events one by one, closing due buckets after each as the history replay does.
+
+    """
+
+    engine = Engine(devices)
+    for event_data in events:
+        engine.new_event_data(event_data)
+        if engine.schedule.pending():
+            engine.tick()
+    return engine
+
+
+def batched(devices, events, size):
+    """
+    Serve events in micro-batches of size events.
+
+    """
+
+    engine = Engine(devices)
+    for i in range(0, len(events), size):
+        engine.ingest_batch(events[i:i+size])
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of micro-batch ingestion.')
+    parser.add_argument('--desks', type=int, default=100, help='Number of desks.')
+    parser.add_argument('--hours', type=int, default=48,  help='Hours of events.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='Batch sizes.')
+    args = parser.parse_args()
+
+    devices = make_devices(args.desks)
+    events  = make_events(devices, hours=args.hours)
+    print('desks {}, {} events'.format(args.desks, len(events)))
+
+    t0 = time.perf_counter()
+    reference = per_event(devices, events).results()
+    seconds = time.perf_counter() - t0
+    print('per event         {:10.0f} events/s'.format(len(events) / seconds))
+
+    for size in args.sizes:
+        t0 = time.perf_counter()
+        results = batched(devices, events, size).results()
+        batch_seconds = time.perf_counter() - t0
+        print('batch {:<6d}      {:10.0f} events/s  {:5.2f}x  {}'.format(
+            size, len(events) / batch_seconds, seconds / batch_seconds, 'equal' if results == reference else 'DIFFERENT',
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Throughput of the desk occupancy kernel per backend against the per-sample Desk.
+One long synthetic desk series is estimated with Desk.append_sample, and with
+kernel.estimate on every available backend, in both threshold modes.
+Reports samples per second and the number of samples whose state differs.
+
+Run from the repository root:
+    python -m benchmarks.kernel --samples 200000
+
+"""
+
+# packages
+import copy
+import time
+import argparse
+import numpy as np
+
+# project
+from benchmarks.synthetic import make_series
+from occupancy            import kernel
+from occupancy.desk       import Desk
+from config.parameters    import params as default_params
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the desk occupancy kernel.')
+    parser.add_argument('--samples', type=int, default=200000, help='Number of samples.')
+    args = parser.parse_args()
+
+    unixtime, diff = make_series(args.samples)
+    print('{} samples, backends {}'.format(args.samples, list(kernel.KERNELS)))
+
+    for mode in ['run', 'window']:
+        params = copy.deepcopy(default_params)
+        params['diff']['threshold_mode'] = mode
+
+        t0 = time.perf_counter()
+        desk = Desk(None, 'benchmark', None, params)
+        for t, d in zip(unixtime, diff):
+            desk.append_sample(None, t, d, d)
+        desk_seconds = time.perf_counter() - t0
+        print('{:<6s} per-sample Desk  {:12.0f} samples/s'.format(mode, args.samples / desk_seconds))
+
+        for backend in kernel.KERNELS:
+            # compile outside of the timing
+            kernel.estimate(unixtime[:10], diff[:10], backend=backend, params=params)
+
+            t0 = time.perf_counter()
+            series = kernel.estimate(unixtime, diff, backend=backend, params=params)
+            seconds = time.perf_counter() - t0
+            print('{:<6s} kernel {:<10s} {:12.0f} samples/s  {:7.1f}x  {} states differ'.format(
+                mode, backend, args.samples / seconds, desk_seconds / seconds, int(np.sum(series['state'] != np.array(desk.state))),
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Load test of the embedded occupancy server.
+Many keep-alive clients request random routes, a share of them conditionally,
+while events are ingested and snapshots published once per second as in the stream.
+Reports request latency percentiles and the time spent building snapshots.
+
+Run from the repository root:
+    python -m benchmarks.server_load --desks 300 --clients 64 --processes 4 --seconds 10
+
+"""
+
+# packages
+import time
+import random
+import argparse
+import threading
+import http.client
+import multiprocessing
+import numpy as np
+
+# project
+from benchmarks.synthetic import make_devices, make_events
+from occupancy.engine     import Engine
+from occupancy.server     import OccupancyServer
+
+
+def client(port, routes, seconds, latencies, seed):
+    """
+    Request random routes over one keep-alive connection for a number of seconds.
+
+    """
+
+    rnd = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    etags = {}
+    t_end = time.time() + seconds
+    while time.time() < t_end:
+        route = rnd.choice(routes)
+        headers = {'If-None-Match': etags[route]} if route in etags and rnd.random() < 0.5 else {}
+        t0 = time.perf_counter()
+        connection.request('GET', route, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - t0)
+        etags[route] = response.getheader('ETag')
+
+
+def clients(port, routes, seconds, n_threads, seed):
+    """
+    Run n_threads clients in one process, apart from the server so they do not share its interpreter.
+
+    Returns
+    -------
+    latencies : list
+        Seconds per request.
+
+    """
+
+    latencies = []
+    threads = [threading.Thread(target=client, args=(port, routes, seconds, latencies, seed*1000 + i)) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the embedded occupancy server.')
+    parser.add_argument('--desks',   type=int, default=300, help='Number of desks.')
+    parser.add_argument('--clients', type=int, default=64,  help='Number of concurrent clients.')
+    parser.add_argument('--seconds', type=int, default=10,  help='Length of test.')
+    parser.add_argument('--processes', type=int, default=4, help='Number of client processes the clients are spread over.')
+    args = parser.parse_args()
+
+    # engine with a day of history, the rest of the events are streamed during the test
+    devices = make_devices(args.desks)
+    events  = make_events(devices, hours=30)
+    split   = len(events) * 9 // 10
+    engine  = Engine(devices)
+    engine.ingest_batch(events[:split])
+
+    # serve on a free port
+    server = OccupancyServer('127.0.0.1', 0)
+    port   = server.httpd.server_address[1]
+    t0 = time.perf_counter()
+    server.publish(engine)
+    print('first publish     {:8.1f} ms'.format((time.perf_counter() - t0)*1000))
+
+    # publish without clients, ten new events between snapshots
+    idle_times = []
+    for _ in range(5):
+        for event_data in events[split:split + 10]:
+            engine.new_event_data(event_data)
+        split += 10
+        t0 = time.perf_counter()
+        server.publish(engine)
+        idle_times.append(time.perf_counter() - t0)
+    print('publish idle      {:8.1f} ms'.format(np.mean(idle_times)*1000))
+
+    routes = ['/desks', '/occupancy', '/occupancy/hourly', '/zones'] + ['/desks/' + device_id for device_id in engine.desks]
+    pool   = multiprocessing.Pool(args.processes)
+    result = pool.starmap_async(clients, [
+        (port, routes, args.seconds, args.clients // args.processes + (i < args.clients % args.processes), i)
+        for i in range(args.processes)
+    ])
+
+    # ingest and publish once per second, as the stream does
+    publish_times, n_events = [], 0
+    t_end, t_publish = time.time() + args.seconds, time.time()
+    while time.time() < t_end and split + n_events < len(events):
+        engine.new_event_data(events[split + n_events])
+        n_events += 1
+        if time.time() - t_publish >= 1:
+            t_publish = time.time()
+            t0 = time.perf_counter()
+            server.publish(engine)
+            publish_times.append(time.perf_counter() - t0)
+        time.sleep(0.001)
+
+    latencies = [latency for part in result.get() for latency in part]
+    pool.close()
+    server.shutdown()
+
+    latencies = np.array(latencies) * 1000
+    print('desks {}, clients {}, {} requests in {} s, {} events ingested'.format(args.desks, args.clients, len(latencies), args.seconds, n_events))
+    print('latency p50       {:8.2f} ms'.format(np.percentile(latencies, 50)))
+    print('latency p99       {:8.2f} ms'.format(np.percentile(latencies, 99)))
+    print('latency max       {:8.2f} ms'.format(latencies.max()))
+    print('publish loaded    {:8.2f} ms'.format(np.mean(publish_times)*1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# packages
+import random
+import datetime
+import numpy as np
+
+
+def make_devices(n_desks, n_references=1):
+    """
+    Device listing of a synthetic project, desks spread over two floors and three zones.
+
+    Parameters
+    ----------
+    n_desks : int
+        Number of desk sensors.
+    n_references : int
+        Number of reference sensors.
+
+    Returns
+    -------
+    devices : list
+        Device information jsons as returned by the devices API.
+
+    """
+
+    devices = []
+    for i in range(n_desks):
+        labels = {'floor': str(i % 2), 'zone': 'z{}'.format(i % 3)}
+        devices.append({'name': 'projects/p/devices/desk{}'.format(i), 'type': 'temperature', 'labels': labels})
+    for i in range(n_references):
+        devices.append({'name': 'projects/p/devices/ref{}'.format(i), 'type': 'temperature', 'labels': {'reference': '', 'floor': '0'}})
+
+    return devices
+
+
+def make_events(devices, hours=48, period=330, seed=0, start=datetime.datetime(2020, 6, 1)):
+    """
+    Temperature events of a synthetic project, desks warming up while occupied during working hours.
+
+    Parameters
+    ----------
+    devices : list
+        Device information jsons, see make_devices().
+    hours : int
+        Length of history.
+    period : int
+        [seconds] Time between events of one device.
+    seed : int
+        Random seed.
+    start : datetime
+        UTC start of history.
+
+    Returns
+    -------
+    events : list
+        Event data jsons sorted in time.
+
+    """
+
+    rnd = random.Random(seed)
+    events = []
+    for device in devices:
+        device_id = device['name'].split('/')[-1]
+        t = start + datetime.timedelta(seconds=rnd.randint(0, period))
+        occupied, temperature = False, 21.0
+        while t < start + datetime.timedelta(hours=hours):
+            if 'reference' in device['labels']:
+                temperature = 21 + rnd.gauss(0, 0.05)
+            else:
+                if 8 <= t.hour < 16 and rnd.random() < 0.05:
+                    occupied = not occupied
+                temperature += ((26 if occupied else 21) - temperature)*0.3 + rnd.gauss(0, 0.05)
+
+            timestamp = t.strftime('%Y-%m-%dT%H:%M:%SZ')
+            events.append({
+                'eventId':    '{}-{}'.format(device_id, len(events)),
+                'targetName': device['name'],
+                'eventType':  'temperature',
+                'data':       {'temperature': {'value': round(temperature, 2), 'updateTime': timestamp}},
+                'timestamp':  timestamp,
+            })
+            t += datetime.timedelta(seconds=period)
+
+    events.sort(key=lambda event_data: event_data['data']['temperature']['updateTime'])
+    return events
+
+
+def make_series(n, seed=0, decay=0.97, p_start=0.01):
+    """
+    Unixtime and reference subtracted temperature of one synthetic desk.
+
+    Parameters
+    ----------
+    n : int
+        Number of samples.
+    seed : int
+        Random seed.
+    decay : float
+        Factor by which the temperature of a left desk decays per sample.
+    p_start : float
+        Probability of a new occupancy per sample.
+
+    Returns
+    -------
+    unixtime : list
+        Sample unixtimes, 1 to 15 minutes apart.
+    diff : list
+        Reference subtracted temperatures.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    unixtime = 1600000000 + np.cumsum(rng.integers(60, 900, n))
+
+    diff, level = np.zeros(n), 0.0
+    for i in range(n):
+        if rng.random() < p_start:
+            level = rng.uniform(1, 4)
+        level *= decay
+        diff[i] = level + rng.normal(0, 0.05)
+
+    return unixtime.tolist(), diff.tolist()
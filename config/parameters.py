@@ -8,11 +8,83 @@ params = {
     },
 
     'diff': {
-        'longest_avg_lookback':     60*60*1     # [seconds] how much data to use when averaging for threshold
+        'longest_avg_lookback':     60*60*1,    # [seconds] how much data to use when averaging for threshold
+        'threshold_mode':           'run',      # 'run' averages the whole occupied run, 'window' at most longest_avg_lookback of it
+        'retain':                   None,       # [seconds] desk history kept in memory, None keeps everything
+    },
+
+    'kernel': {
+        'backend':              'auto',     # 'numba', 'python' or 'auto' for numba when installed, used by bulk estimation and seam reconciliation
     },
 
     'occupancy': {
         'working_hours':    [8, 16],
+    },
+
+    'schedule': {
+        'grace':                60*5,       # [seconds] time after end of hour or day during which late events are still counted
+        'tick':                 1,          # [seconds] longest sleep of the bucket closing timer while streaming
+    },
+
+    'logging': {
+        'queue_size':           10000,      # maximum number of records waiting for the writer thread
+        'aggregate_interval':   10,         # [seconds] time between event summaries in stream
+    },
+
+    'zones': {
+        'label_keys':           ['building', 'floor', 'zone'],  # device labels forming the hierarchy, top level first
+    },
+
+    'dedup': {
+        'window':               60*60*24,   # [seconds] how far back duplicates are detected per device
+        'max_entries':          4096,       # maximum number of remembered events per device
+    },
+
+    'devices': {
+        'page_size':            100,        # number of devices requested per listing page
+        'refresh_interval':     60*10,      # [seconds] time between periodic device list refreshes in stream
+        'unknown_cooldown':     60*1,       # [seconds] minimum time between refreshes triggered by unknown devices
+        'timeout':              30,         # [seconds] longest wait for a device listing page
+    },
+
+    'batch': {
+        'interval':             0.5,        # [seconds] longest time an event waits in a stream micro-batch
+        'max_size':             1000,       # maximum number of events per micro-batch
+    },
+
+    'server': {
+        'host':                 '127.0.0.1',
+        'port':                 8080,
+        'publish_interval':     1,          # [seconds] minimum time between published snapshots
+        'series_length':        288,        # number of recent samples served per desk
+    },
+
+    'shared': {
+        'name':                 'desk-occupancy',   # shared memory segment name
+        'capacity':             1024,               # maximum number of desks in segment
+    },
+
+    'export': {
+        'format':               'parquet',  # parquet, arrow or csv, csv is used if pyarrow is missing
+        'row_group_size':       10000,      # maximum number of rows held in memory and written per part file
+        'interval':             60*5,       # [seconds] time between exports in stream
+    },
+
+    'archive': {
+        'interval':             60*1,       # [seconds] time between archive appends in stream
+    },
+
+    'report': {
+        'format':               'png',      # png or svg
+        'workers':              None,       # number of rendering processes, None for one per cpu
+        'max_points':           2000,       # series are downsampled to at most this many points
+        'dpi':                  100,
+        'figsize':              [12, 12],   # [inches]
+    },
+
+    'replay': {
+        'warmup':               60*60*3,    # [seconds] history replayed before each chunk for the desk state to converge
+        'workers':              None,       # number of replay processes, None for one per chunk
     }
 }
 
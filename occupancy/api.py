@@ -0,0 +1,73 @@
+# packages
+import os
+import logging
+import requests
+
+# project
+import occupancy.helpers as hlp
+
+# module logger
+logger = logging.getLogger(__name__)
+
+
+def fetch_event_history(api_url_base, project_id, auth, devices, history_params):
+    """
+    For each device, request all events in the time range of history_params from API.
+
+    Parameters
+    ----------
+    api_url_base : str
+        Base url of the DT Developer API.
+    project_id : str
+        Identifier of project.
+    auth : tuple
+        Service account key and secret.
+    devices : list
+        Device information jsons of devices to fetch events for.
+    history_params : dictionary
+        Event listing filters including start_time and end_time.
+
+    Returns
+    -------
+    event_history : list
+        Event data jsons sorted in time.
+
+    """
+
+    # initialise empty event list
+    event_history = []
+    history_params = dict(history_params)
+
+    # iterate devices
+    for device in devices:
+        # isolate device identifier
+        device_id = os.path.basename(device['name'])
+    
+        # some printing
+        logger.info('-- Getting event history for %s', device_id)
+    
+        # initialise next page token
+        history_params['page_token'] = None
+    
+        # set endpoints for event history
+        event_list_url = "{}/projects/{}/devices/{}/events".format(api_url_base, project_id, device_id)
+    
+        # perform paging
+        while history_params['page_token'] != '':
+            event_listing = requests.get(event_list_url, auth=auth, params=history_params)
+            event_json = event_listing.json()
+
+            if event_listing.status_code < 300:
+                history_params['page_token'] = event_json['nextPageToken']
+                event_history += event_json['events']
+            else:
+                logger.error('%s', event_json)
+                hlp.print_error('Status Code: {}'.format(event_listing.status_code), terminate=True)
+    
+            if history_params['page_token'] != '':
+                logger.debug('\t-- paging')
+    
+    # sort event history in time
+    event_history.sort(key=hlp.json_sort_key, reverse=False)
+
+    return event_history
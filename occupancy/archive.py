@@ -0,0 +1,306 @@
+# packages
+import os
+import json
+import datetime
+import numpy as np
+
+# project
+import occupancy.helpers as hlp
+
+
+# fixed width per-desk sample
+DESK_DTYPE = np.dtype([
+    ('unixtime',    '<i8'),
+    ('temperature', '<f8'),
+    ('diff',        '<f8'),
+    ('roc',         '<f8'),
+    ('roc_thrs',    '<f8'),
+    ('dsl_thrs',    '<f8'),
+    ('state',       'i1'),
+])
+
+# fixed width rollup bucket, NaN percentage for buckets without desks
+ROLLUP_DTYPE = np.dtype([
+    ('unixtime',    '<i8'),
+    ('percentage',  '<f8'),
+])
+
+# segment naming per series kind, desks by day and the short rollups by month
+SEGMENT_FORMATS = {'device': '%Y-%m-%d', 'rollup': '%Y-%m'}
+
+
+class SeriesArchive():
+    """
+    Append-only on-disk archive of per-desk series and occupancy rollups.
+    Every series is split into fixed width binary segments, one file per device and
+    day, or per month for rollups, holding raw numpy records. A small index file next
+    to each segment holds its first and last unixtime and row count. It lets reads
+    open only the segments that overlap the requested range, and those are memory
+    mapped, so a query over a year of data only touches the pages it slices. Appends
+    rewrite only the index of the segments they touch, and a series' index is read
+    on first use, so no file is parsed at startup.
+
+    """
+
+    def __init__(self, root, project_id):
+        # add to self
+        self.root = os.path.join(root, 'project={}'.format(project_id))
+
+        # key -> {segment name: (first, last, n_rows)}, loaded per series on first use
+        self.index = {}
+
+        # key -> (desk, index of first row not yet archived counted from the first row it ever held)
+        self.taken = {}
+        self.__migrate()
+
+
+    def __migrate(self):
+        # archives written before the index was sharded keep one index of all series
+        path = os.path.join(self.root, '_index.json')
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            index = json.load(f)
+        for key, segments in index.items():
+            for name, entry in segments.items():
+                hlp.write_json_atomic(self.__path(key, name, '.json'), entry)
+        os.remove(path)
+
+
+    def __segments(self, key):
+        """
+        Return segment index of series, loading it from disk on first use.
+        Rows of an append that was interrupted before its segment index was saved,
+        including whole segments that never got an index, are truncated away, and
+        an interrupted rewrite is completed if its index was saved.
+
+        Parameters
+        ----------
+        key : str
+            Series key, 'device=ID' or 'rollup=NAME'.
+
+        Returns
+        -------
+        segments : dictionary
+            Segment name -> (first unixtime, last unixtime, number of rows).
+
+        """
+
+        if key in self.index:
+            return self.index[key]
+
+        dtype     = self.__dtype(key)
+        directory = os.path.join(self.root, key)
+        segments  = {}
+        for file_name in (os.listdir(directory) if os.path.isdir(directory) else []):
+            if not file_name.endswith('.bin'):
+                continue
+            name = file_name[:-len('.bin')]
+
+            # a segment without index holds no committed rows
+            n_rows = 0
+            if os.path.exists(self.__path(key, name, '.json')):
+                with open(self.__path(key, name, '.json')) as f:
+                    first, last, n_rows = json.load(f)
+                segments[name] = (first, last, n_rows)
+
+            # a rewrite is complete once its index is saved, finish or drop it
+            path = self.__path(key, name)
+            if os.path.exists(path + '.tmp'):
+                if os.path.getsize(path + '.tmp') == n_rows * dtype.itemsize:
+                    os.replace(path + '.tmp', path)
+                else:
+                    os.remove(path + '.tmp')
+
+            if os.path.getsize(path) > n_rows * dtype.itemsize:
+                os.truncate(path, n_rows * dtype.itemsize)
+
+        self.index[key] = segments
+        return segments
+
+
+    @staticmethod
+    def __dtype(key):
+        return DESK_DTYPE if key.startswith('device=') else ROLLUP_DTYPE
+
+
+    def __path(self, key, name, extension='.bin'):
+        return os.path.join(self.root, key, name + extension)
+
+
+    def last_unixtime(self, key):
+        """
+        Return unixtime of last archived row of series, None if empty.
+
+        """
+
+        segments = self.__segments(key)
+        if not segments:
+            return None
+        return max(last for _, last, _ in segments.values())
+
+
+    def __append(self, key, records):
+        """
+        Add records to their segments.
+        Records newer than a segment's last row are appended to it, a segment that
+        receives older rows, from out of order samples, is rewritten in time order.
+
+        Parameters
+        ----------
+        key : str
+            Series key, 'device=ID' or 'rollup=NAME'.
+        records : ndarray
+            Structured array of series dtype, in any order.
+
+        """
+
+        if len(records) == 0:
+            return
+        records = records[np.argsort(records['unixtime'], kind='stable')]
+
+        # split at segment boundaries
+        fmt = SEGMENT_FORMATS[key.split('=')[0]]
+        names = np.array([datetime.datetime.utcfromtimestamp(t).strftime(fmt) for t in records['unixtime']])
+        bounds = np.flatnonzero(names[1:] != names[:-1]) + 1
+
+        segments = self.__segments(key)
+        os.makedirs(os.path.join(self.root, key), exist_ok=True)
+        for part, name in zip(np.split(records, bounds), names[np.r_[0, bounds]]):
+            first, last, n_rows = segments.get(name, (int(part['unixtime'][0]), None, 0))
+            path = self.__path(key, name)
+
+            if n_rows > 0 and part['unixtime'][0] <= last:
+                # merge into a sorted copy, it replaces the segment once its index is saved
+                merged = np.concatenate([np.fromfile(path, dtype=part.dtype, count=n_rows), part])
+                merged = merged[np.argsort(merged['unixtime'], kind='stable')]
+                merged.tofile(path + '.tmp')
+                segments[name] = (int(merged['unixtime'][0]), int(merged['unixtime'][-1]), len(merged))
+                hlp.write_json_atomic(self.__path(key, name, '.json'), segments[name])
+                os.replace(path + '.tmp', path)
+                continue
+
+            # write right after the indexed rows, dropping any left by a failed append
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                f.truncate(n_rows * part.dtype.itemsize)
+                f.seek(n_rows * part.dtype.itemsize)
+                part.tofile(f)
+
+            # index only after rows are on disk, each segment has its own small index file
+            segments[name] = (first, int(part['unixtime'][-1]), n_rows + len(part))
+            hlp.write_json_atomic(self.__path(key, name, '.json'), segments[name])
+
+
+    def append(self, engine):
+        """
+        Archive everything added since last append.
+
+        Parameters
+        ----------
+        engine : Engine
+            Object holding desks and occupancy rollups.
+
+        """
+
+        # per-desk series, rows are in arrival order which need not be time order
+        for device_id, desk in engine.desks.items():
+            key = 'device={}'.format(device_id)
+            n = len(desk.unixtime)
+            if key not in self.taken or self.taken[key][0] is not desk:
+                # first append of this desk, skip rows archived before, out of order ones included
+                unixtime = np.asarray(desk.unixtime, dtype=np.int64)
+                archived = self.read(key, start=unixtime.min())['unixtime'] if n > 0 else []
+                index = np.flatnonzero(~np.isin(unixtime, archived))
+            else:
+                index = np.arange(max(0, self.taken[key][1] - desk.n_trimmed), n)
+            self.taken[key] = (desk, desk.n_trimmed + n)
+            if len(index) == 0:
+                continue
+
+            # new rows are a tail of the lists, except on a first append with out of order rows
+            records = np.empty(len(index), dtype=DESK_DTYPE)
+            for column in DESK_DTYPE.names:
+                values = getattr(desk, column)
+                records[column] = values[index[0]:] if len(index) == n - index[0] else [values[i] for i in index]
+            self.__append(key, records)
+
+        # closed rollup buckets only, open ones are still being filled
+        for name in ['hourly', 'daily']:
+            timestamps, percentages = engine.closed_buckets(name)
+            records = np.empty(len(timestamps), dtype=ROLLUP_DTYPE)
+            records['unixtime']   = [int(t.timestamp()) for t in timestamps]
+            records['percentage'] = [np.nan if p is None else p for p in percentages]
+
+            # buckets are closed in time order, only those after the last archived one are new
+            last = self.last_unixtime('rollup={}'.format(name))
+            if last is not None:
+                records = records[records['unixtime'] > last]
+            self.__append('rollup={}'.format(name), records)
+
+
+    def read(self, key, start=None, end=None):
+        """
+        Read archived rows of one series within a time range.
+
+        Parameters
+        ----------
+        key : str
+            Series key, 'device=ID' or 'rollup=NAME'.
+        start : int
+            First unixtime to include, None for no lower bound.
+        end : int
+            Last unixtime to include, None for no upper bound.
+
+        Returns
+        -------
+        records : ndarray
+            Structured array of series dtype.
+
+        """
+
+        dtype = self.__dtype(key)
+        start = -np.inf if start is None else start
+        end   =  np.inf if end   is None else end
+
+        # only segments overlapping range are opened
+        parts = []
+        for name, (first, last, n_rows) in sorted(self.__segments(key).items()):
+            if last < start or first > end or n_rows == 0:
+                continue
+            segment = np.memmap(self.__path(key, name), dtype=dtype, mode='r', shape=(n_rows,))
+            i = np.searchsorted(segment['unixtime'], start, side='left')
+            j = np.searchsorted(segment['unixtime'], end,   side='right')
+            parts.append(np.array(segment[i:j]))
+
+        if len(parts) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(parts)
+
+
+    def desk(self, device_id, start=None, end=None):
+        """
+        Read archived series of one desk, see read().
+
+        """
+
+        return self.read('device={}'.format(device_id), start, end)
+
+
+    def rollup(self, name, start=None, end=None):
+        """
+        Read archived 'hourly' or 'daily' occupancy, see read().
+
+        """
+
+        return self.read('rollup={}'.format(name), start, end)
+
+
+    def devices(self):
+        """
+        Return identifiers of all archived desks.
+
+        """
+
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(key.split('=', 1)[1] for key in os.listdir(self.root) if key.startswith('device=') and self.__segments(key))
@@ -0,0 +1,85 @@
+# packages
+import time
+import queue
+
+# project
+from config.parameters import params
+
+
+# marks end of stream in queue
+_CLOSED = object()
+
+
+class MicroBatcher():
+    """
+    Collects events handed in by a producer thread into micro-batches.
+    A batch is released once its oldest event has waited interval seconds or once it
+    holds max_size events, whichever comes first. No event therefore waits longer than
+    interval before its batch is handed on, however slowly the stream trickles in.
+
+    """
+
+    def __init__(self, interval=None, max_size=None):
+        # add to self
+        self.interval = params['batch']['interval'] if interval is None else interval
+        self.max_size = params['batch']['max_size'] if max_size is None else max_size
+
+        # (arrival time, event) pairs from producer
+        self.queue = queue.Queue()
+
+
+    def put(self, event_data):
+        """
+        Hand in one event, called from the producer thread.
+
+        Parameters
+        ----------
+        event_data : dictionary
+            Data json containing new event data.
+
+        """
+
+        self.queue.put((time.monotonic(), event_data))
+
+
+    def close(self):
+        """
+        Signal end of stream, the batch being collected is still released.
+
+        """
+
+        self.queue.put((time.monotonic(), _CLOSED))
+
+
+    def batches(self):
+        """
+        Yield batches of events in arrival order until closed.
+
+        Yields
+        ------
+        batch : list
+            Event data jsons.
+
+        """
+
+        while True:
+            # block until first event of batch
+            t_first, event_data = self.queue.get()
+            if event_data is _CLOSED:
+                return
+
+            # deadline is set by arrival of oldest event, not by when collecting started
+            batch    = [event_data]
+            deadline = t_first + self.interval
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    _, event_data = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event_data is _CLOSED:
+                    yield batch
+                    return
+                batch.append(event_data)
+
+            yield batch
@@ -0,0 +1,112 @@
+# packages
+import hashlib
+import collections
+
+# project
+from occupancy         import helpers
+from config.parameters import params as default_params
+
+
+def _event_key(event_data):
+    """
+    Hash event identifier, or update time if no identifier is given, to a 64 bit integer.
+
+    Parameters
+    ----------
+    event_data : dictionary
+        Event data json in dictionary form.
+
+    Returns
+    -------
+    key : int
+        Compact hashed event key.
+
+    """
+
+    if 'eventId' in event_data:
+        raw = event_data['eventId']
+    else:
+        raw = event_data['data']['temperature']['updateTime']
+
+    return int.from_bytes(hashlib.blake2b(raw.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class EventDeduplicator():
+    """
+    Bounded per-device index of recently seen events.
+    Each device keeps hashed event keys in arrival order. Keys older than the
+    time window relative to the newest event, or beyond the maximum number of
+    entries, are evicted so memory stays flat on long running streams.
+
+    """
+
+    def __init__(self, params=None):
+        # add to self
+        self.params = default_params if params is None else params
+
+        # device_id -> OrderedDict of key -> unixtime
+        self.index = {}
+
+        # suppressed duplicate counters
+        self.suppressed   = 0
+        self.n_suppressed = collections.Counter()
+
+
+    def is_duplicate(self, device_id, event_data, unixtime=None):
+        """
+        Check event against index of device and remember it if new.
+
+        Parameters
+        ----------
+        device_id : str
+            Identifier of source device.
+        event_data : dictionary
+            Event data json in dictionary form.
+        unixtime : int
+            Already parsed event update time, parsed from event_data if None.
+
+        Returns
+        -------
+        duplicate : bool
+            True if event was seen before and should be dropped.
+
+        """
+
+        key = _event_key(event_data)
+        if device_id not in self.index:
+            self.index[device_id] = collections.OrderedDict()
+        seen = self.index[device_id]
+
+        # known event, refresh its recency
+        if key in seen:
+            seen.move_to_end(key)
+            self.suppressed += 1
+            self.n_suppressed[device_id] += 1
+            return True
+
+        # remember new event
+        if unixtime is None:
+            _, unixtime = helpers.convert_event_data_timestamp(event_data['data']['temperature']['updateTime'])
+        seen[key] = unixtime
+
+        # evict oldest entries by count and by time window
+        while len(seen) > self.params['dedup']['max_entries']:
+            seen.popitem(last=False)
+        while len(seen) > 1 and next(iter(seen.values())) < unixtime - self.params['dedup']['window']:
+            seen.popitem(last=False)
+
+        return False
+
+
+    def forget(self, device_id):
+        """
+        Drop index of a device that is no longer tracked.
+
+        Parameters
+        ----------
+        device_id : str
+            Device identifier.
+
+        """
+
+        self.index.pop(device_id, None)
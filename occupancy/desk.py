@@ -1,9 +1,24 @@
 # packages
+import bisect
+import collections
 import numpy             as np
 
 # project
 from occupancy         import helpers
-from config.parameters import params
+from occupancy         import kernel
+from config.parameters import params as default_params
+
+
+def _run_start(state, i):
+    """
+    Return index of first sample of the occupied run containing sample i.
+
+    """
+
+    while i > 0 and state[i-1] == 1:
+        i -= 1
+    return i
+
 
 class Desk():
     """
@@ -13,11 +28,12 @@ class Desk():
 
     """
 
-    def __init__(self, device, device_id, args):
+    def __init__(self, device, device_id, args, params=None):
         # add to self
         self.args      = args
         self.device    = device
         self.device_id = device_id
+        self.params    = default_params if params is None else params
 
         # initialise lists
         self.timestamp   = []   # timestamps
@@ -33,6 +49,11 @@ class Desk():
         self.state_start_index = 0     # index for which the state flag previously changed from 0 to 1
         self.state_flag        = False # set 1 for occupancy and 0 for vacancy
         self.state_swapped     = False # set true if state swapped on current iteration
+        self.n_trimmed         = 0     # number of samples dropped from the start of the lists by trim
+
+        # (unixtime, diff) of occupied samples within lookback and their running sum, window mode only
+        self.window     = collections.deque()
+        self.window_sum = 0.0
 
 
     def __update_roc_threshold(self, prev_thrs_value, current_roc_value):
@@ -54,8 +75,8 @@ class Desk():
         """
         
         # time-based increase
-        new_thrs_value = min(params['roc']['gamma_max'], prev_thrs_value + params['roc']['beta'])
-        new_thrs_value = max(params['roc']['gamma_min'], new_thrs_value - current_roc_value * params['roc']['alpha'])
+        new_thrs_value = min(self.params['roc']['gamma_max'], prev_thrs_value + self.params['roc']['beta'])
+        new_thrs_value = max(self.params['roc']['gamma_min'], new_thrs_value - current_roc_value * self.params['roc']['alpha'])
 
         return new_thrs_value
 
@@ -85,6 +106,11 @@ class Desk():
                 self.state_flag = True
                 self.state_start_index = len(self.state)-1
 
+                # restart averaging window at start of occupancy
+                self.window.clear()
+                self.window.append((self.unixtime[-1], self.diff[-1]))
+                self.window_sum = self.diff[-1]
+
         else:
             # check wether or not temperature is below threshold
             if self.diff[-1] < self.dsl_thrs[-2]:
@@ -93,13 +119,65 @@ class Desk():
                 self.state[-1] = 1
         
                 # update temperature threshold
-                self.dsl_thrs[-1] = np.mean(self.diff[self.state_start_index:])
+                if self.params['diff']['threshold_mode'] == 'window':
+                    self.dsl_thrs[-1] = self.__window_mean()
+                else:
+                    self.dsl_thrs[-1] = np.mean(self.diff[self.state_start_index:])
         
         # reset state swapped
         self.state_swapped = False
 
 
-    def new_event_data(self, event_data, latest_reference):
+    def __window_mean(self):
+        """
+        Add latest sample to averaging window, evict samples older than the lookback
+        and return the mean of what remains. O(1) per sample, amortized.
+
+        Returns
+        -------
+        mean : float
+            Mean of diff over the occupied run, at most longest_avg_lookback seconds back.
+
+        """
+
+        self.window.append((self.unixtime[-1], self.diff[-1]))
+        self.window_sum += self.diff[-1]
+
+        # evict by time, the latest sample always stays
+        oldest = self.unixtime[-1] - self.params['diff']['longest_avg_lookback']
+        while self.window[0][0] < oldest:
+            self.window_sum -= self.window.popleft()[1]
+
+        return self.window_sum / len(self.window)
+
+
+    def trim(self, retain):
+        """
+        Drop samples older than retain seconds before the latest one.
+        Trimming happens in steps of retain seconds to keep the cost amortized O(1),
+        and never cuts into the current occupied run when the threshold averages it.
+
+        Parameters
+        ----------
+        retain : int
+            Seconds of history to keep.
+
+        """
+
+        if len(self.unixtime) == 0 or self.unixtime[-1] - self.unixtime[0] <= 2*retain:
+            return
+
+        cut = bisect.bisect_left(self.unixtime, self.unixtime[-1] - retain)
+        if self.state_flag and self.params['diff']['threshold_mode'] != 'window':
+            cut = min(cut, self.state_start_index)
+
+        for key in ['timestamp', 'unixtime', 'temperature', 'diff', 'roc', 'roc_thrs', 'dsl_thrs', 'state']:
+            del getattr(self, key)[:cut]
+        self.state_start_index = max(0, self.state_start_index - cut)
+        self.n_trimmed += cut
+
+
+    def new_event_data(self, event_data, latest_reference, timestamp=None, unixtime=None):
         """
         Receive new event data json from Director and iterate estimation algorithm one step.
 
@@ -110,31 +188,57 @@ class Desk():
         latest_reference : float
             The most recent reference temperature value.
             Is 0 if no reference is yet found.
+        timestamp : datetime
+            Already parsed event timestamp, parsed from event_data if None.
+        unixtime : int
+            Already parsed event unixtime, parsed from event_data if None.
 
         """
 
         # isolate timestamp and temperature value
         temperature = event_data['data']['temperature']['value']
-        timestamp, unixtime = helpers.convert_event_data_timestamp(event_data['timestamp'])
+        if timestamp is None:
+            timestamp, unixtime = helpers.convert_event_data_timestamp(event_data['timestamp'])
 
         # check for duplicate event
         if len(self.unixtime) > 0 and unixtime - self.unixtime[-1] == 0:
             return
 
+        # average temperature with last value if less than 10 minutes ago
+        if len(self.temperature) > 0 and unixtime - self.unixtime[-1] < 60*10:
+            temperature = (self.temperature[-1]+temperature)/2
+
+        # append sample and iterate algorithm
+        self.append_sample(timestamp, unixtime, temperature, temperature - latest_reference)
+
+
+    def append_sample(self, timestamp, unixtime, temperature, diff):
+        """
+        Append one already smoothed and reference subtracted sample and iterate estimation algorithm.
+        Used directly when continuing a desk from samples computed elsewhere.
+
+        Parameters
+        ----------
+        timestamp : datetime
+            Sample timestamp in Pandas Timestamp format.
+        unixtime : int
+            Sample unixtime.
+        temperature : float
+            Smoothed desk temperature.
+        diff : float
+            Reference subtracted temperature.
+
+        """
+
         # append time lists
         self.timestamp.append(timestamp)
         self.unixtime.append(unixtime)
-
-        # average temperature with last value if less than 10 minutes ago
-        if len(self.temperature) > 0 and self.unixtime[-1] - self.unixtime[-2] < 60*10:
-            self.temperature.append((self.temperature[-1]+temperature)/2)
-        else:
-            self.temperature.append(temperature)
+        self.temperature.append(temperature)
 
         # append one default value to supporting lists
-        self.diff.append(self.temperature[-1] - latest_reference)
+        self.diff.append(diff)
         self.roc.append(0)
-        self.roc_thrs.append(params['roc']['gamma_max'])
+        self.roc_thrs.append(self.params['roc']['gamma_max'])
         self.dsl_thrs.append(np.nan)
         self.state.append(0)
 
@@ -145,3 +249,149 @@ class Desk():
         # iterate algorithm for last sample
         self.__iterate_core()
 
+        # bound memory if configured
+        if self.params['diff']['retain'] is not None:
+            self.trim(self.params['diff']['retain'])
+
+
+    def append_samples(self, timestamps, unixtimes, temperatures, diffs, backend=None):
+        """
+        Append many already smoothed and reference subtracted samples at once.
+        Same result as calling append_sample for each, but the estimation algorithm
+        runs over typed arrays with the kernel backend, compiled if numba is installed.
+        Run mode thresholds use a running sum, so they may differ from np.mean in the last digits.
+
+        Parameters
+        ----------
+        timestamps : list
+            Sample timestamps in Pandas Timestamp format.
+        unixtimes : list
+            Sample unixtimes, ascending and newer than the latest sample.
+        temperatures : list
+            Smoothed desk temperatures.
+        diffs : list
+            Reference subtracted temperatures.
+        backend : str
+            'auto', 'numba' or 'python', self.params['kernel']['backend'] if None.
+
+        """
+
+        if len(unixtimes) == 0:
+            return
+        n = len(self.unixtime)
+
+        # append samples and default values as in append_sample
+        self.timestamp.extend(timestamps)
+        self.unixtime.extend(unixtimes)
+        self.temperature.extend(temperatures)
+        self.diff.extend(diffs)
+        self.roc.extend([0]*len(unixtimes))
+        self.roc_thrs.extend([self.params['roc']['gamma_max']]*len(unixtimes))
+        self.dsl_thrs.extend([np.nan]*len(unixtimes))
+        self.state.extend([0]*len(unixtimes))
+
+        # the kernel needs the previous sample and the averaged part of the current run
+        offset = max(0, n-1)
+        run_start = offset
+        if self.state_flag:
+            if self.params['diff']['threshold_mode'] == 'window':
+                run_start = bisect.bisect_left(self.unixtime, self.window[0][0])
+            else:
+                run_start = self.state_start_index
+            offset = min(offset, run_start)
+
+        arrays = {
+            'unixtime': np.array(self.unixtime[offset:], dtype=np.int64),
+            'diff':     np.array(self.diff[offset:],     dtype=np.float64),
+            'roc':      np.array(self.roc[offset:],      dtype=np.float64),
+            'roc_thrs': np.array(self.roc_thrs[offset:], dtype=np.float64),
+            'dsl_thrs': np.array(self.dsl_thrs[offset:], dtype=np.float64),
+            'state':    np.array(self.state[offset:],    dtype=np.int8),
+        }
+        start = max(1, n - offset)
+        flag, new_start, window_start = kernel.run(
+            arrays['unixtime'], arrays['diff'], arrays['roc'], arrays['roc_thrs'], arrays['dsl_thrs'], arrays['state'],
+            start=start, state_flag=self.state_flag, run_start=run_start - offset, backend=backend, params=self.params,
+        )
+
+        # write results back to lists
+        for key in ['roc', 'roc_thrs', 'dsl_thrs', 'state']:
+            getattr(self, key)[offset+start:] = arrays[key][start:].tolist()
+
+        # take over algorithm state, run start only moves if a new run started
+        if flag and (not self.state_flag or new_start != run_start - offset):
+            self.state_start_index = offset + new_start
+        self.state_flag    = flag
+        self.state_swapped = False
+        if flag:
+            window = slice(offset + window_start, None)
+            self.window     = collections.deque(zip(self.unixtime[window], self.diff[window]))
+            self.window_sum = sum(self.diff[window])
+
+        # bound memory if configured
+        if self.params['diff']['retain'] is not None:
+            self.trim(self.params['diff']['retain'])
+
+
+    def converged(self, other, i):
+        """
+        Check if algorithm state of this desk matches that of another desk after its sample i.
+
+        Parameters
+        ----------
+        other : Desk
+            Desk fed with the same samples from a different starting point.
+        i : int
+            Sample index in other.
+
+        Returns
+        -------
+        converged : bool
+            True if both would produce the same output for any further samples.
+
+        """
+
+        if len(self.unixtime) == 0 or self.unixtime[-1] != other.unixtime[i]:
+            return False
+
+        # occupied runs must have started at the same sample to average the same samples
+        if self.state[-1] == 1 and other.state[i] == 1:
+            if self.unixtime[_run_start(self.state, len(self.state)-1)] != other.unixtime[_run_start(other.state, i)]:
+                return False
+
+        return (self.state[-1] == other.state[i]
+            and np.isclose(self.temperature[-1], other.temperature[i])
+            and np.isclose(self.roc_thrs[-1], other.roc_thrs[i])
+            and np.isclose(self.dsl_thrs[-1], other.dsl_thrs[i], equal_nan=True))
+
+
+    def extend(self, other, start):
+        """
+        Append samples of another desk from index start and take over its algorithm state.
+        The other desk must have converged with this one at sample start-1.
+
+        Parameters
+        ----------
+        other : Desk
+            Desk holding the samples to append.
+        start : int
+            First sample index in other to append.
+
+        """
+
+        n = len(self.unixtime)
+        for key in ['timestamp', 'unixtime', 'temperature', 'diff', 'roc', 'roc_thrs', 'dsl_thrs', 'state']:
+            getattr(self, key).extend(getattr(other, key)[start:])
+
+        # take over state, run start only moves if other started a new run after start
+        self.state_flag = other.state_flag
+        if other.state_start_index >= start:
+            self.state_start_index = other.state_start_index - start + n
+
+        # averaging window holds the same samples once converged
+        self.window     = collections.deque(other.window)
+        self.window_sum = other.window_sum
+
+        # bound memory if configured
+        if self.params['diff']['retain'] is not None:
+            self.trim(self.params['diff']['retain'])
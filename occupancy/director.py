@@ -3,30 +3,45 @@ import os
 import json
 import time
 import requests
+import logging
 import argparse
+import threading
 import datetime
 import sseclient
 import numpy             as np
-import pandas            as pd
 import matplotlib
 import matplotlib.pyplot as plt
 
 # project
 import occupancy.helpers as hlp
+import occupancy.log     as log
 import config.styling    as stl
-from occupancy.desk      import Desk
-from occupancy.reference import Reference
+from occupancy.api       import fetch_event_history
+from occupancy.engine    import Engine
+from occupancy.batch     import MicroBatcher
+from occupancy.replay    import replay_history, compare
+from occupancy.server    import OccupancyServer
+from occupancy.shared    import SharedStatePublisher
+from occupancy.export    import SeriesExporter
+from occupancy.archive   import SeriesArchive
+from occupancy.report    import render_report
 from config.parameters   import params
 
-# force matplotlib TkAgg backend
-matplotlib.use('TkAgg')
+# module logger
+logger = logging.getLogger(__name__)
+
+# force matplotlib TkAgg backend, keep default when no display is available
+try:
+    matplotlib.use('TkAgg')
+except ImportError:
+    pass
 
 
 class Director():
     """
-    Keeps track of all sensors in project and separates desks from references.
-    Spawns one Desk object per desk sensors and one Reference object.
-    When new event_data json is received, relay it to the correct desk- or reference object.
+    Command line and API shell around the occupancy Engine.
+    Parses arguments, fetches devices and events from the DT Developer API,
+    relays them to the Engine and visualises and publishes its results.
 
     """
 
@@ -37,30 +52,58 @@ class Director():
         self.project_id   = project_id
         self.api_url_base = api_url_base
 
-        # occupancy lists
-        self.hourly_occupancy_timestamp  = []
-        self.hourly_occupancy_percentage = []
-        self.daily_occupancy_timestamp   = []
-        self.daily_occupancy_percentage  = []
-
         # set stream endpoint
         self.stream_endpoint = "{}/projects/{}/devices:stream".format(self.api_url_base, self.project_id)
 
         # parse system arguments
         self.__parse_sysargs()
 
+        # buffered logging and event summaries
+        log.setup(self.args['loglevel'], self.args['jsonlog'])
+        self.event_log = log.EventAggregator()
+
         # set filters for fetching data
         self.__set_filters()
 
-        # fetch list of devices in project
-        self.__fetch_project_devices()
-
-        # spawn devices instances
-        self.__spawn_devices()
+        # fetch list of devices in project and spawn devices instances
+        self.engine = Engine(self.__fetch_project_devices(), self.args)
 
         # to console
         self.print_devices_information()
 
+        # guards engine against the bucket closing timer while streaming
+        self.lock = threading.Lock()
+
+        # while streaming, device listings are fetched on a background thread
+        self.streaming = False
+        self.refresher = None
+
+        # start query server
+        self.server       = None
+        self.last_publish = 0
+        self.unpublished  = False  # set if state changed since last publish
+        if self.args['serve']:
+            self.server = OccupancyServer(params['server']['host'], params['server']['port'])
+            logger.info('Serving occupancy on http://%s:%s', params['server']['host'], params['server']['port'])
+
+        # create shared memory segment
+        self.publisher = None
+        if self.args['share']:
+            self.publisher = SharedStatePublisher(params['shared']['name'], params['shared']['capacity'])
+            logger.info('Publishing occupancy to shared memory segment %s', params['shared']['name'])
+
+        # resume export from manifest
+        self.exporter    = None
+        self.last_export = 0
+        if self.args['export'] is not None:
+            self.exporter = SeriesExporter(self.args['export'], self.project_id)
+
+        # append to existing archive
+        self.archive      = None
+        self.last_archive = 0
+        if self.args['archive'] is not None:
+            self.archive = SeriesArchive(self.args['archive'], self.project_id)
+
 
     def __parse_sysargs(self):
         """
@@ -77,10 +120,20 @@ class Director():
         # general arguments
         parser.add_argument('--starttime', metavar='', help='Event history UTC starttime [YYYY-MM-DDTHH:MM:SSZ].', required=False, default=now)
         parser.add_argument('--endtime',   metavar='', help='Event history UTC endtime [YYYY-MM-DDTHH:MM:SSZ].',   required=False, default=now)
+        parser.add_argument('--export',    metavar='', help='Directory to export series and occupancy to.',        required=False, default=None)
+        parser.add_argument('--archive',   metavar='', help='Directory of memory-mapped series archive to append to.', required=False, default=None)
+        parser.add_argument('--report',    metavar='', help='Directory to render debug plots of all desks to.',    required=False, default=None)
+        parser.add_argument('--loglevel',  metavar='', help='Logging level, DEBUG logs every event.',               required=False, default='INFO')
+        parser.add_argument('--chunks',    metavar='', help='Replay event history in this many parallel time chunks.', required=False, default=1, type=int)
 
         # boolean flags
         parser.add_argument('--plot',   action='store_true', help='Plot the estimated desk occupancy.')
         parser.add_argument('--debug',  action='store_true', help='Visualise algorithm operation.')
+        parser.add_argument('--serve',  action='store_true', help='Serve live occupancy over HTTP/JSON.')
+        parser.add_argument('--share',  action='store_true', help='Publish live occupancy to shared memory.')
+        parser.add_argument('--jsonlog', action='store_true', help='Log JSON lines instead of plain text.')
+        parser.add_argument('--batch',   action='store_true', help='Process stream events in latency bounded micro-batches.')
+        parser.add_argument('--compare', action='store_true', help='Also replay history sequentially and report speedup and disagreement of --chunks.')
 
         # convert to dictionary
         self.args = vars(parser.parse_args())
@@ -112,233 +165,251 @@ class Director():
         }
 
 
-    def __fetch_project_devices(self):
+    def __fetch_project_devices(self, terminate=True):
         """
         Fetch information about all devices in project.
+        Pages through the device listing until no next page token is given.
+
+        Parameters
+        ----------
+        terminate : bool
+            Terminate execution on a failed request if True, return None otherwise.
+
+        Returns
+        -------
+        devices : list
+            Device information jsons in dictionary format, None if a request failed.
 
         """
 
-        # request list
+        # initialise empty device list
+        devices = []
+
+        # set endpoint and paging parameters
         devices_list_url = "{}/projects/{}/devices".format(self.api_url_base,  self.project_id)
-        device_listing = requests.get(devices_list_url, auth=(self.username, self.password))
-        
-        # remove fluff
-        if device_listing.status_code < 300:
-            self.devices = device_listing.json()['devices']
-        else:
-            print(device_listing.json())
-            hlp.print_error('Status Code: {}'.format(device_listing.status_code), terminate=True)
+        listing_params = {
+            'page_size': params['devices']['page_size'],
+            'page_token': None,
+        }
+
+        # perform paging
+        while listing_params['page_token'] != '':
+            try:
+                device_listing = requests.get(devices_list_url, auth=(self.username, self.password), params=listing_params, timeout=params['devices']['timeout'])
+            except requests.exceptions.RequestException as e:
+                if terminate:
+                    hlp.print_error('Device listing failed: {}'.format(e), terminate=True)
+                logger.warning('Device listing failed: %s', e)
+                return None
 
+            # check status before parsing, error bodies need not be json
+            if device_listing.status_code >= 300:
+                if terminate:
+                    logger.error('%s', device_listing.text)
+                    hlp.print_error('Status Code: {}'.format(device_listing.status_code), terminate=True)
+                logger.warning('Device listing failed with status code %d', device_listing.status_code, extra={'body': device_listing.text})
+                return None
 
-    def __spawn_devices(self):
+            # remove fluff
+            listing_json = device_listing.json()
+            devices += listing_json['devices']
+            listing_params['page_token'] = listing_json.get('nextPageToken', '')
+
+        return devices
+
+
+    def refresh_devices(self):
         """
-        Use list of devices to spawn a Desk- and Reference object.
-        One Reference object in total and one Desk object per desk sensor.
+        Fetch device list again and let the engine apply the difference in place.
+        A failed fetch keeps the cached devices, the next refresh tries again.
+        While streaming, the list is fetched on a background thread so that a slow
+        listing never holds up events, and only applied under the engine lock.
 
         """
 
-        # empty lists of devices
-        self.desks      = {}
-        self.reference  = Reference(self.args)
+        if not self.streaming:
+            self.__apply_devices(self.__fetch_project_devices(terminate=False))
+            return
+
+        # one refresh at a time
+        if self.refresher is not None and self.refresher.is_alive():
+            return
 
-        # iterate list of devices
-        for device in self.devices:
-            # verify temperature type
-            if device['type'] == 'temperature':
-                # get device id
-                device_id = os.path.basename(device['name'])
+        def refresh():
+            devices = self.__fetch_project_devices(terminate=False)
+            with self.lock:
+                self.__apply_devices(devices)
 
-                # check if reference label is set
-                if 'reference' in device['labels'].keys():
-                    # append an initialised reference object
-                    self.reference.add_device(device, device_id)
-                else:
-                    # append an initialised desk object
-                    self.desks[device_id] = Desk(device, device_id, self.args)
+        self.refresher = threading.Thread(target=refresh, daemon=True)
+        self.refresher.start()
 
 
-    def __occupancy(self, current_timestamp):
+    def __apply_devices(self, devices):
         """
-        Aggregate occupancy data of all sensors into a percentage.
+        Apply a fetched device list to the engine and log the changes.
 
         Parameters
         ----------
-        current_timestamp : datetime
-            UTC timestamp of latest event data in pandas datetime format.
+        devices : list
+            Device information jsons, None if the fetch failed.
 
         """
 
-        # get current timestamp
-        timestamp, _ = hlp.convert_event_data_timestamp(current_timestamp)
+        # keep cache on transient errors
+        if devices is None:
+            self.engine.registry.touch()
+            return
 
-        # round timestamp to last hour and day
-        timestamp_hour = timestamp.floor('H')
-        timestamp_day  = timestamp.floor('D')
+        # diff new listing against cache
+        added, removed, reclassified, relabeled = self.engine.set_devices(devices)
 
-        # initialise if empty
-        if len(self.hourly_occupancy_timestamp) == 0: 
-            self.hourly_occupancy_timestamp.append(timestamp_hour)
-            self.hourly_occupancy_percentage.append(None)
-        if len(self.daily_occupancy_timestamp) == 0: 
-            self.daily_occupancy_timestamp.append(timestamp_day + pd.Timedelta('12h'))
-            self.daily_occupancy_percentage.append(None)
+        # to console
+        for device_id in added:
+            logger.info('-- %-30s%s', device_id, 'added as ' + self.engine.registry.kinds[device_id])
+        for device_id in removed:
+            logger.info('-- %-30s%s', device_id, 'removed')
+        for device_id in reclassified:
+            logger.info('-- %-30s%s', device_id, 'reclassified as ' + self.engine.registry.kinds[device_id])
+        for device_id in relabeled:
+            logger.info('-- %-30s%s', device_id, 'relabeled')
 
-        # check if new hour
-        if self.hourly_occupancy_timestamp[-1] != timestamp_hour:
-            # update occupancy for last hour
-            self.__update_hourly_occupancy()
 
-            # append new hour
-            self.hourly_occupancy_timestamp.append(timestamp_hour)
-            self.hourly_occupancy_percentage.append(None)
+    def __fetch_event_history(self):
+        """
+        For each sensor in project, request all events since --starttime from API.
 
-        # check if new day
-        if self.daily_occupancy_timestamp[-1].floor('D') != timestamp_day:
-            # update daily occupancy (within working hours)
-            self.__update_daily_occupancy()
-            
-            # append new day
-            self.daily_occupancy_timestamp.append(timestamp_day + pd.Timedelta('12h'))
-            self.daily_occupancy_percentage.append(None)
+        """
 
+        self.event_history = fetch_event_history(
+            self.api_url_base,
+            self.project_id,
+            (self.username, self.password),
+            self.engine.registry.devices.values(),
+            self.history_params,
+        )
 
-    def __update_hourly_occupancy(self):
-        """
-        Calculate occupancy percentage with hourly resolution.
 
+    def __new_event_data(self, event_data, cout=True):
         """
+        Receive new event_data json and pass it along to the engine.
 
-        # set zero
-        self.hourly_occupancy_percentage[-1] = 0
-
-        # iterate known desks
-        for i, sid in enumerate(self.desks.keys()):
-            # reset activity flag
-            active = False
+        Parameters
+        ----------
+        event_data : dictionary
+            Data json containing new event data.
+        cout : bool
+            Will print event information to console if True.
 
-            # verify any data
-            j = len(self.desks[sid].timestamp)
-            if j > 0:
-                # iterate back in time
-                while not active and j > 0 and self.desks[sid].timestamp[j-1] >= self.hourly_occupancy_timestamp[-1]:
-                    # check if occupancy triggered
-                    if self.desks[sid].state[j-1] == 1:
-                        active = True
+        """
 
-                    # iterate backwards
-                    j -= 1
+        # get id of source sensor
+        source_id = os.path.basename(event_data['targetName'])
 
-            # add to sum if active
-            if active:
-                self.hourly_occupancy_percentage[-1] += 1
+        # unknown source might be a newly added device, refresh if not done recently
+        if 'temperature' in event_data['data'].keys() and not self.engine.knows(source_id):
+            if self.engine.registry.seconds_since_refresh() > params['devices']['unknown_cooldown']:
+                self.refresh_devices()
 
-        # normalise to a percentage
-        self.hourly_occupancy_percentage[-1] = (self.hourly_occupancy_percentage[-1] / len(self.desks)) * 100
+        # serve event to engine
+        role = self.engine.new_event_data(event_data)
+        if cout and role is not None: self.event_log.add(source_id, role)
 
 
-    def __update_daily_occupancy(self):
+    def __publish(self, force=False):
         """
-        Calculate occupancy percentage daily resolution.
+        Publish current state to consumers, at most once per publish interval.
+
+        Parameters
+        ----------
+        force : bool
+            Publish regardless of time since last publish.
 
         """
 
-        # set zero
-        self.daily_occupancy_percentage[-1] = 0
+        # limit rate of publishing, the timer thread publishes skipped changes later
+        if not force and time.time() - self.last_publish < params['server']['publish_interval']:
+            self.unpublished = True
+            return
+        self.last_publish = time.time()
+        self.unpublished  = False
 
-        # median percentage list
-        median_percentage = []
+        # swap in new query server snapshot
+        if self.server is not None:
+            self.server.publish(self.engine)
 
-        # iterate back in time 1 day
-        i = len(self.hourly_occupancy_timestamp)
-        while i > 0 and self.hourly_occupancy_timestamp[i-1] >= self.daily_occupancy_timestamp[-1].floor('D'):
-            # set working hours
-            t1 = self.daily_occupancy_timestamp[-1].floor('D') + pd.Timedelta('{}h'.format(params['occupancy']['working_hours'][0]))
-            t2 = self.daily_occupancy_timestamp[-1].floor('D') + pd.Timedelta('{}h'.format(params['occupancy']['working_hours'][1]))
-        
-            # only use working hours
-            if self.hourly_occupancy_timestamp[i-1] >= t1 and self.hourly_occupancy_timestamp[i-1] <= t2:
-                median_percentage.append(self.hourly_occupancy_percentage[i-1])
-            
-            # iterate
-            i -= 1
+        # write shared memory segment
+        if self.publisher is not None:
+            self.publisher.publish(self.engine)
 
-        # set daily value
-        self.daily_occupancy_percentage[-1] = np.median(median_percentage)
+        # append new rows to export, less often as it touches disk
+        if self.exporter is not None and (force or time.time() - self.last_export > params['export']['interval']):
+            self.last_export = time.time()
+            self.exporter.export(self.engine)
 
+        # append new rows to archive
+        if self.archive is not None and (force or time.time() - self.last_archive > params['archive']['interval']):
+            self.last_archive = time.time()
+            self.archive.append(self.engine)
 
-    def __fetch_event_history(self):
-        """
-        For each sensor in project, request all events since --starttime from API.
 
+    def __replay_history(self):
         """
+        Fetch event history and serve it to engine in time order.
 
-        # initialise empty event list
-        self.event_history = []
+        """
 
-        # iterate devices
-        for device in self.devices:
-            # isolate device identifier
-            device_id = os.path.basename(device['name'])
-        
-            # some printing
-            print('-- Getting event history for {}'.format(device_id))
-        
-            # initialise next page token
-            self.history_params['page_token'] = None
-        
-            # set endpoints for event history
-            event_list_url = "{}/projects/{}/devices/{}/events".format(self.api_url_base, self.project_id, device_id)
-        
-            # perform paging
-            while self.history_params['page_token'] != '':
-                event_listing = requests.get(event_list_url, auth=(self.username, self.password), params=self.history_params)
-                event_json = event_listing.json()
-
-                if event_listing.status_code < 300:
-                    self.history_params['page_token'] = event_json['nextPageToken']
-                    self.event_history += event_json['events']
-                else:
-                    print(event_json)
-                    hlp.print_error('Status Code: {}'.format(event_listing.status_code), terminate=True)
-        
-                if self.history_params['page_token'] != '':
-                    print('\t-- paging')
+        # get list of hsitoric events
+        self.__fetch_event_history()
         
-        # sort event history in time
-        self.event_history.sort(key=hlp.json_sort_key, reverse=False)
+        # estimate occupancy for history 
+        cc = 0
+        for i, event_data in enumerate(self.event_history):
+            cc = hlp.loop_progress(cc, i, len(self.event_history), 25, name='event history')
+            # serve event to director
+            self.__new_event_data(event_data, cout=False)
 
+            # close buckets this event has moved past, in event time order
+            if self.engine.schedule.pending():
+                self.engine.tick()
 
-    def __new_event_data(self, event_data, cout=True):
-        """
-        Receive new event_data json and pass it along to the correct device object.
 
-        Parameters
-        ----------
-        event_data : dictionary
-            Data json containing new event data.
-        cout : bool
-            Will print event information to console if True.
+    def __replay_history_chunked(self):
+        """
+        Replay event history in parallel time chunks and replace engine by the stitched result.
+        With --compare, history is also replayed sequentially to measure speedup and disagreement.
 
         """
 
-        # get id of source sensor
-        source_id = os.path.basename(event_data['targetName'])
+        devices = list(self.engine.registry.devices.values())
 
-        # verify temperature event
-        if 'temperature' in event_data['data'].keys():
-            # check if source device is known
-            if source_id in self.desks.keys():
-                # serve event to desk
-                self.desks[source_id].new_event_data(event_data, self.reference.latest_value)
-                if cout: print('-- {:<30}{}'.format(source_id, 'desk'))
+        def chunked():
+            return replay_history(
+                self.api_url_base,
+                self.project_id,
+                (self.username, self.password),
+                devices,
+                self.history_params,
+                self.args,
+                self.args['chunks'],
+                params['replay']['workers'],
+            )
 
-            elif source_id in self.reference.devices.keys():
-                # serve new temperature value to reference
-                self.reference.new_event_data(event_data, source_id)
-                if cout: print('-- {:<30}{}'.format(source_id, 'reference'))
+        def sequential():
+            self.__replay_history()
+            return self.engine
 
-            # update occupancy stats
-            self.__occupancy(event_data['data']['temperature']['updateTime'])
+        if self.args['compare']:
+            engine, stats = compare(chunked, sequential)
+            logger.info(
+                '-- Chunked replay %.1f s, sequential %.1f s, speedup %.2fx, %d of %d desk samples differ',
+                stats['chunked_seconds'], stats['sequential_seconds'], stats['speedup'], stats['differ'], stats['samples'],
+                extra=stats,
+            )
+        else:
+            engine, stats = chunked()
+
+        logger.info('-- %d of %d seams reconciled by replaying %d samples', stats['disagreed'], stats['seams'], stats['replayed'], extra=stats)
+        self.engine = engine
 
 
     def run_history(self):
@@ -351,25 +422,33 @@ class Director():
         if not self.fetch_history:
             return
 
-        # get list of hsitoric events
-        self.__fetch_event_history()
-        
-        # estimate occupancy for history 
-        cc = 0
-        for i, event_data in enumerate(self.event_history):
-            cc = hlp.loop_progress(cc, i, len(self.event_history), 25, name='event history')
-            # serve event to director
-            self.__new_event_data(event_data, cout=False)
-        
+        # replay in parallel time chunks
+        if self.args['chunks'] > 1:
+            self.__replay_history_chunked()
+        else:
+            self.__replay_history()
+
+        if self.engine.dedup.suppressed > 0:
+            logger.info('-- %d duplicate events suppressed', self.engine.dedup.suppressed, extra={'duplicates': self.engine.dedup.suppressed})
+        if self.engine.n_late > 0:
+            logger.info('-- %d events arrived after their hour was closed', self.engine.n_late, extra={'late': self.engine.n_late})
+
+        # make history results available to consumers
+        self.__publish(force=True)
+
         # initialise plot
         if self.args['plot']:
-            print('\nClose the blocking plot to start stream.')
-            print('A new non-blocking plot will appear for stream.')
+            logger.info('Close the blocking plot to start stream.')
+            logger.info('A new non-blocking plot will appear for stream.')
             self.initialise_plot()
             self.plot_progress(blocking=True)
         # plot debug
         if self.args['debug']:
             self.plot_debug()
+        # render debug report off-screen
+        if self.args['report'] is not None:
+            logger.info('Rendering debug report...')
+            logger.info('Report written to %s', render_report(self.engine, self.args['report']))
 
 
     def run_stream(self, n_reconnects=5):
@@ -384,13 +463,74 @@ class Director():
         """
 
         # cout
-        print("Listening for events... (press CTRL-C to abort)")
+        logger.info('Listening for events... (press CTRL-C to abort)')
     
         # reinitialise plot
         if self.args['plot']:
             self.initialise_plot()
             self.plot_progress(blocking=False)
     
+        # from now on the engine is shared with timer threads, refresh devices in the background
+        self.streaming = True
+
+        # close buckets on time during quiet periods
+        threading.Thread(target=self.__close_buckets, daemon=True).start()
+
+        # summarize events on time during quiet periods
+        self.event_log.start()
+
+        try:
+            self.__run_stream(n_reconnects)
+        finally:
+            # write export rows still held back for the current day
+            if self.exporter is not None:
+                with self.lock:
+                    self.exporter.export(self.engine, force=True)
+
+            # summary of the last interval
+            self.event_log.stop()
+
+
+    def __run_stream(self, n_reconnects):
+        """
+        Listen to stream, serving events one by one or in micro-batches.
+
+        """
+
+        # collect events into micro-batches on a reader thread
+        if self.args['batch']:
+            batcher = MicroBatcher()
+
+            def read():
+                try:
+                    self.__listen(batcher.put, n_reconnects)
+                finally:
+                    batcher.close()
+
+            threading.Thread(target=read, daemon=True).start()
+            for batch in batcher.batches():
+                with self.lock:
+                    self.__new_event_batch(batch)
+                    self.__after_events()
+
+        # serve events one by one
+        else:
+            self.__listen(self.__new_stream_event, n_reconnects)
+
+
+    def __listen(self, handle, n_reconnects):
+        """
+        Listen to stream and hand each event on, reconnecting on connection errors.
+
+        Parameters
+        ----------
+        handle : callable
+            Called with each event data json.
+        n_reconnects : int
+            Number of reconnection attempts at disconnect.
+
+        """
+
         # loop indefinetly
         nth_reconnect = 0
         while nth_reconnect < n_reconnects:
@@ -403,48 +543,118 @@ class Director():
                 client = sseclient.SSEClient(response)
         
                 # listen for events
-                print('Connected.')
+                logger.info('Connected.')
                 for event in client.events():
                     # new data received
                     event_data = json.loads(event.data)['result']['event']
         
-                    # serve event to director
-                    self.__new_event_data(event_data)
-        
-                    # plot progress
-                    if self.args['plot']:
-                        self.plot_progress(blocking=False)
+                    # hand event on
+                    handle(event_data)
             
             # catch errors
             # Note: Some VPNs seem to cause quite a lot of packet corruption (?)
             except requests.exceptions.ConnectionError:
                 nth_reconnect += 1
-                print('Connection lost, reconnection attempt {}/{}'.format(nth_reconnect, n_reconnects))
+                logger.warning('Connection lost, reconnection attempt %d/%d', nth_reconnect, n_reconnects)
             except requests.exceptions.ChunkedEncodingError:
                 nth_reconnect += 1
-                print('An error occured, reconnection attempt {}/{}'.format(nth_reconnect, n_reconnects))
+                logger.warning('An error occured, reconnection attempt %d/%d', nth_reconnect, n_reconnects)
             except KeyError:
-                print('Error in event package. Skipping...')
-                print(event_data)
-                print()
+                logger.warning('Error in event package. Skipping...', extra={'event': event_data})
             
             # wait 1s before attempting to reconnect
             time.sleep(1)
 
 
+    def __new_stream_event(self, event_data):
+        """
+        Serve one stream event and run periodic work.
+
+        """
+
+        with self.lock:
+            self.__new_event_data(event_data)
+            self.__after_events()
+
+
+    def __new_event_batch(self, batch):
+        """
+        Serve a micro-batch of stream events to the engine in one call.
+
+        Parameters
+        ----------
+        batch : list
+            Event data jsons in arrival order.
+
+        """
+
+        # unknown sources might be newly added devices, refresh if not done recently
+        for event_data in batch:
+            if 'temperature' in event_data['data'].keys() and not self.engine.knows(os.path.basename(event_data['targetName'])):
+                if self.engine.registry.seconds_since_refresh() > params['devices']['unknown_cooldown']:
+                    self.refresh_devices()
+                break
+
+        # serve batch to engine
+        roles = self.engine.ingest_batch(batch)
+        for event_data, role in zip(batch, roles):
+            if role is not None: self.event_log.add(os.path.basename(event_data['targetName']), role)
+
+
+    def __close_buckets(self):
+        """
+        Close hourly and daily buckets on wall-clock time, off the event path.
+        Runs on a timer thread while streaming, sleeping until the next deadline.
+        Also publishes changes whose publishing was skipped by the rate limit.
+
+        """
+
+        while True:
+            with self.lock:
+                if self.engine.tick(time.time()) > 0:
+                    self.__publish(force=True)
+                elif self.unpublished:
+                    self.__publish()
+                deadline = self.engine.schedule.next_deadline()
+                if self.unpublished:
+                    deadline = min(np.inf if deadline is None else deadline, self.last_publish + params['server']['publish_interval'])
+
+            # wake up at next deadline, buckets opened meanwhile are caught within one tick
+            sleep = params['schedule']['tick']
+            if deadline is not None:
+                sleep = min(sleep, max(0, deadline - time.time()))
+            time.sleep(sleep)
+
+
+    def __after_events(self):
+        """
+        Publish, refresh devices and plot after new events were served.
+
+        """
+
+        self.__publish()
+
+        # periodically look for added, removed or relabeled devices
+        if self.engine.registry.seconds_since_refresh() > params['devices']['refresh_interval']:
+            self.refresh_devices()
+
+        # plot progress
+        if self.args['plot']:
+            self.plot_progress(blocking=False)
+
+
     def print_devices_information(self):
         """
         Print information about active devices in stream.
 
         """
 
-        print('\nDirector initialised for devices:')
+        logger.info('Director initialised for devices:')
         # print desks
-        for desk in self.desks:
-            print('-- {:<30}{}'.format(desk, 'desk'))
-        for device in self.reference.devices:
-            print('-- {:<30}{}'.format(device, 'reference'))
-        print()
+        for desk in self.engine.desks:
+            logger.info('-- %-30s%s', desk, 'desk')
+        for device in self.engine.reference.devices:
+            logger.info('-- %-30s%s', device, 'reference')
 
 
     def initialise_plot(self):
@@ -477,20 +687,20 @@ class Director():
         self.ax[2].cla()
 
         # plot all desks
-        for i, desk in enumerate(self.desks):
+        for i, desk in enumerate(self.engine.desks):
             color = stl.wheel[i%len(stl.wheel)]
-            self.ax[0].plot(self.desks[desk].timestamp, self.desks[desk].temperature,             '-', color=color, label=desk)
-            self.ax[1].plot(self.desks[desk].timestamp, np.array(self.desks[desk].state) + i*1.5, '-', color=color, label=desk)
+            self.ax[0].plot(self.engine.desks[desk].timestamp, self.engine.desks[desk].temperature,             '-', color=color, label=desk)
+            self.ax[1].plot(self.engine.desks[desk].timestamp, np.array(self.engine.desks[desk].state) + i*1.5, '-', color=color, label=desk)
         self.ax[0].set_ylabel('Temperature [deg]')
         self.ax[1].set_ylabel('Occupancy State')
 
         # plot reference
-        self.ax[0].plot(self.reference.timestamp, self.reference.temperature, '.-', color=stl.VB[1], linewidth=2,  label='reference')
+        self.ax[0].plot(self.engine.reference.timestamp, self.engine.reference.temperature, '.-', color=stl.VB[1], linewidth=2,  label='reference')
         # self.ax[0].legend(loc='upper left')
         
         # plot occupancies
-        self.ax[2].plot(self.hourly_occupancy_timestamp, self.hourly_occupancy_percentage, '-',  linewidth=2, label='Hourly Occupancy', color=stl.NS[1])
-        self.ax[2].plot(self.daily_occupancy_timestamp,  self.daily_occupancy_percentage,  '.-', linewidth=3, label='Daily Occupancy', color=stl.SS[1])
+        self.ax[2].plot(self.engine.hourly_occupancy_timestamp, self.engine.hourly_occupancy_percentage, '-',  linewidth=2, label='Hourly Occupancy', color=stl.NS[1])
+        self.ax[2].plot(self.engine.daily_occupancy_timestamp,  self.engine.daily_occupancy_percentage,  '.-', linewidth=3, label='Daily Occupancy', color=stl.SS[1])
         self.ax[2].legend(loc='upper right')
         self.ax[2].set_ylim([0, 100])
         self.ax[2].set_ylabel('Occupancy [%]')
@@ -511,39 +721,39 @@ class Director():
         """
 
         # iterate desks
-        print('\nDEBUG')
-        print('Close plots to see next sensor.')
-        for desk in self.desks:
+        logger.info('DEBUG')
+        logger.info('Close plots to see next sensor.')
+        for desk in self.engine.desks:
             # re-initialise figure
             self.initialise_debug_plot()
 
-            print(desk)
+            logger.info(desk)
             self.dax[0].cla()
-            self.dax[0].plot(self.desks[desk].timestamp, self.desks[desk].temperature, '-', color=stl.NS[1], linewidth=stl.lw, label='Desk Temperature')
-            self.dax[0].plot(self.reference.timestamp,   self.reference.temperature,   '-', color=stl.SS[1], linewidth=stl.lw, label='Reference Temperature')
+            self.dax[0].plot(self.engine.desks[desk].timestamp, self.engine.desks[desk].temperature, '-', color=stl.NS[1], linewidth=stl.lw, label='Desk Temperature')
+            self.dax[0].plot(self.engine.reference.timestamp,   self.engine.reference.temperature,   '-', color=stl.SS[1], linewidth=stl.lw, label='Reference Temperature')
             self.dax[0].set_title(desk)
             self.dax[0].set_xlabel('Timestamp')
             self.dax[0].set_ylabel('Temperature [deg]')
             self.dax[0].legend(loc='upper left')
 
             self.dax[1].cla()
-            self.dax[1].plot(self.desks[desk].timestamp, self.desks[desk].diff,      '-', color=stl.NS[1], linewidth=stl.lw, label='Differenced Temperature')
-            self.dax[1].plot(self.desks[desk].timestamp, self.desks[desk].dsl_thrs, '-', color=stl.SS[1], linewidth=stl.lw, label='Downslope Threshold')
+            self.dax[1].plot(self.engine.desks[desk].timestamp, self.engine.desks[desk].diff,      '-', color=stl.NS[1], linewidth=stl.lw, label='Differenced Temperature')
+            self.dax[1].plot(self.engine.desks[desk].timestamp, self.engine.desks[desk].dsl_thrs, '-', color=stl.SS[1], linewidth=stl.lw, label='Downslope Threshold')
             self.dax[1].set_xlabel('Timestamp')
             self.dax[1].set_ylabel('Temperature [deg]')
             self.dax[1].legend(loc='upper left')
 
             self.dax[2].cla()
-            self.dax[2].plot(self.desks[desk].timestamp, self.desks[desk].roc,      '-', color=stl.NS[1], linewidth=stl.lw, label='Rate of Change')
-            self.dax[2].plot(self.desks[desk].timestamp, self.desks[desk].roc_thrs, '-', color=stl.SS[1], linewidth=stl.lw, label='Dynamic Threshold')
+            self.dax[2].plot(self.engine.desks[desk].timestamp, self.engine.desks[desk].roc,      '-', color=stl.NS[1], linewidth=stl.lw, label='Rate of Change')
+            self.dax[2].plot(self.engine.desks[desk].timestamp, self.engine.desks[desk].roc_thrs, '-', color=stl.SS[1], linewidth=stl.lw, label='Dynamic Threshold')
             self.dax[2].set_xlabel('Timestamp')
             self.dax[2].set_ylabel('Temperature [deg/min]')
             self.dax[2].legend(loc='upper left')
 
             self.dax[3].cla()
-            n = len(self.desks[desk].state)
-            self.dax[3].fill_between(self.desks[desk].timestamp[-n:], np.zeros(n), self.desks[desk].state, alpha=0.75, color=stl.SS[1], label='Detected Occupancy')
-            self.dax[3].plot(self.desks[desk].timestamp[:], self.desks[desk].state,      '-', color=stl.NS[1], linewidth=stl.lw, label='No Occupancy')
+            n = len(self.engine.desks[desk].state)
+            self.dax[3].fill_between(self.engine.desks[desk].timestamp[-n:], np.zeros(n), self.engine.desks[desk].state, alpha=0.75, color=stl.SS[1], label='Detected Occupancy')
+            self.dax[3].plot(self.engine.desks[desk].timestamp[:], self.engine.desks[desk].state,      '-', color=stl.NS[1], linewidth=stl.lw, label='No Occupancy')
             self.dax[3].set_xlabel('Timestamp')
             self.dax[3].set_ylabel('Binary')
             self.dax[3].legend(loc='upper left')
@@ -0,0 +1,488 @@
+# packages
+import os
+import logging
+import numpy  as np
+import pandas as pd
+
+# project
+import occupancy.helpers as hlp
+from occupancy.desk      import Desk
+from occupancy.reference import Reference
+from occupancy.registry  import DeviceRegistry
+from occupancy.dedup     import EventDeduplicator
+from occupancy.zones     import ZoneTree
+from occupancy.schedule  import BucketScheduler
+from config.parameters   import params as default_params
+
+# module logger
+logger = logging.getLogger(__name__)
+
+
+class Engine():
+    """
+    In-memory desk occupancy estimation for one project.
+    Holds one Desk object per desk sensor, the Reference and the zone hierarchy,
+    and aggregates occupancy into hourly and daily percentages.
+    Performs no network or console I/O, events and device listings are handed in
+    by the caller, so it can be embedded and constructed cheaply. Algorithm parameters
+    are given per engine, so engines with different thresholds can run side by side.
+
+    """
+
+    def __init__(self, devices, args=None, params=None):
+        # add to self
+        self.args   = {} if args is None else args
+        self.params = default_params if params is None else params
+
+        # occupancy lists
+        self.hourly_occupancy_timestamp  = []
+        self.hourly_occupancy_percentage = []
+        self.daily_occupancy_timestamp   = []
+        self.daily_occupancy_percentage  = []
+
+        # newest open buckets as unixtime, buckets are closed on schedule
+        self.newest_hour = None
+        self.newest_day  = None
+        self.schedule    = BucketScheduler(self.params['schedule']['grace'])
+        self.n_late      = 0
+
+        # empty lists of devices
+        self.desks      = {}
+        self.reference  = Reference(self.args)
+        self.dedup      = EventDeduplicator(self.params)
+        self.zones      = ZoneTree(self.args, params=self.params)
+        self.registry   = DeviceRegistry()
+
+        # spawn devices instances
+        self.set_devices(devices)
+
+
+    def __add_device(self, device_id):
+        """
+        Spawn a Desk object or add to Reference for a registered device.
+
+        Parameters
+        ----------
+        device_id : str
+            Device identifier known to the registry.
+
+        """
+
+        device = self.registry.devices[device_id]
+
+        # check if reference label is set
+        if self.registry.kinds[device_id] == 'reference':
+            # append an initialised reference object
+            self.reference.add_device(device, device_id)
+            self.zones.add_reference(device_id, device)
+        else:
+            # append an initialised desk object
+            self.desks[device_id] = Desk(device, device_id, self.args, self.params)
+            self.zones.add_desk(device_id, device)
+
+
+    def __remove_device(self, device_id):
+        """
+        Drop a desk or reference device while leaving all others untouched.
+
+        Parameters
+        ----------
+        device_id : str
+            Identifier of device to remove.
+
+        """
+
+        if device_id in self.desks:
+            del self.desks[device_id]
+            self.zones.remove_desk(device_id)
+        elif device_id in self.reference.devices:
+            self.reference.remove_device(device_id)
+            self.zones.remove_reference(device_id)
+        self.dedup.forget(device_id)
+
+
+    def set_devices(self, devices):
+        """
+        Apply a complete device listing, diffed against the current one.
+        Added devices are spawned, removed devices dropped and devices that
+        changed between desk and reference are moved, all other desks keep their state.
+        Devices with changed labels are moved to their new zone.
+
+        Parameters
+        ----------
+        devices : list
+            Device information jsons in dictionary format.
+
+        Returns
+        -------
+        changes : tuple
+            Lists of added, removed, reclassified and relabeled device identifiers.
+
+        """
+
+        # diff new listing against cache
+        added, removed, reclassified, relabeled = self.registry.update(devices)
+
+        # apply changes
+        for device_id in removed + reclassified:
+            self.__remove_device(device_id)
+        for device_id in reclassified + added:
+            self.__add_device(device_id)
+
+        # move relabeled devices within zone hierarchy, desks keep their state
+        for device_id in relabeled:
+            device = self.registry.devices[device_id]
+            if device_id in self.desks:
+                self.desks[device_id].device = device
+                self.zones.remove_desk(device_id)
+                self.zones.add_desk(device_id, device)
+                self.zones.update_desk(self.desks[device_id])
+            else:
+                self.zones.remove_reference(device_id)
+                self.zones.add_reference(device_id, device)
+
+        return added, removed, reclassified, relabeled
+
+
+    def knows(self, device_id):
+        """
+        Return True if device is a tracked desk or reference.
+
+        """
+
+        return device_id in self.desks or device_id in self.reference.devices
+
+
+    def __occupancy(self, timestamp, unixtime, watermark):
+        """
+        Open the hourly and daily bucket of an event.
+        Buckets are only ever opened after all existing ones, an event older than the newest
+        bucket is counted in its own bucket while that is still within its grace period.
+        Closing is left to tick(), so no rollup is computed on the event path.
+
+        Parameters
+        ----------
+        timestamp : datetime
+            UTC timestamp of latest event data in pandas datetime format.
+        unixtime : int
+            Same timestamp as unixtime.
+        watermark : int
+            Newest event unixtime seen up to and including this event.
+
+        Returns
+        -------
+        hour : int
+            Unixtime of the open hour bucket the event counts in, None if it arrived too late.
+
+        """
+
+        hour = unixtime - unixtime % 3600
+
+        # check if new hour, a new day is always a new hour
+        if self.newest_hour is None or hour > self.newest_hour:
+            # append new hour
+            timestamp_hour = timestamp.floor('H')
+            self.hourly_occupancy_timestamp.append(timestamp_hour)
+            self.hourly_occupancy_percentage.append(None)
+            self.zones.open_hour(timestamp_hour, hour)
+            self.schedule.add('hour', hour, 60*60)
+            self.newest_hour = hour
+
+            # check if new day
+            day = unixtime - unixtime % (60*60*24)
+            if self.newest_day is None or day > self.newest_day:
+                # append new day
+                timestamp_day = timestamp.floor('D')
+                self.daily_occupancy_timestamp.append(timestamp_day + pd.Timedelta('12h'))
+                self.daily_occupancy_percentage.append(None)
+                self.zones.open_day(timestamp_day, day)
+                self.schedule.add('day', day, 60*60*24)
+                self.newest_day = day
+
+        # bucket already closed, or due in event time but not yet ticked
+        if hour not in self.zones.open_hours or self.schedule.is_due(hour, 60*60, watermark):
+            self.n_late += 1
+            return None
+        return hour
+
+
+    def __update_hourly_occupancy(self, hour):
+        """
+        Calculate occupancy percentage with hourly resolution.
+        Counts of desks active during the hour are kept by the zone hierarchy,
+        closing the hour sets the percentage of every zone at once.
+
+        Parameters
+        ----------
+        hour : int
+            Unixtime of hour to close.
+
+        """
+
+        # close hour for all zones, project root included
+        timestamp_hour = self.zones.open_hours[hour]
+        self.zones.close_hour(hour)
+
+        # project wide value
+        root = self.zones.root
+        self.hourly_occupancy_percentage[hlp.last_index(self.hourly_occupancy_timestamp, timestamp_hour)] = \
+            root.hourly_occupancy_percentage[hlp.last_index(root.hourly_occupancy_timestamp, timestamp_hour)]
+
+
+    def __update_daily_occupancy(self, day):
+        """
+        Calculate occupancy percentage daily resolution.
+
+        Parameters
+        ----------
+        day : int
+            Unixtime of day to close.
+
+        """
+
+        # close day for all zones, project root included
+        timestamp_day = self.zones.open_days[day] + pd.Timedelta('12h')
+        self.zones.close_day(day)
+
+        # project wide value
+        root = self.zones.root
+        self.daily_occupancy_percentage[hlp.last_index(self.daily_occupancy_timestamp, timestamp_day)] = \
+            root.daily_occupancy_percentage[hlp.last_index(root.daily_occupancy_timestamp, timestamp_day)]
+
+
+    def tick(self, now=None):
+        """
+        Close all buckets whose end plus grace period has passed.
+        Event time is always used, wall-clock time only if given, so that a caller
+        can close buckets on time during quiet periods without any events.
+
+        Parameters
+        ----------
+        now : float
+            Wall-clock unixtime.
+
+        Returns
+        -------
+        n_closed : int
+            Number of closed hourly and daily buckets.
+
+        """
+
+        due = self.schedule.due(now)
+        for kind, start in due:
+            if kind == 'hour':
+                self.__update_hourly_occupancy(start)
+            else:
+                self.__update_daily_occupancy(start)
+
+        return len(due)
+
+
+    def flush(self):
+        """
+        Close all open hourly and daily buckets without waiting for their deadline.
+        Only to be called when no more events are expected for these buckets.
+
+        """
+
+        self.tick(float('inf'))
+
+
+    def closed_buckets(self, name):
+        """
+        Return the closed part of the 'hourly' or 'daily' occupancy series.
+        Open buckets are always the newest, so closed buckets are a prefix of the series.
+
+        Returns
+        -------
+        timestamps : list
+            Bucket timestamps.
+        percentages : list
+            Bucket percentages.
+
+        """
+
+        timestamps  = getattr(self, '{}_occupancy_timestamp'.format(name))
+        percentages = getattr(self, '{}_occupancy_percentage'.format(name))
+        n_closed = len(timestamps) - len(self.zones.open_hours if name == 'hourly' else self.zones.open_days)
+
+        return timestamps[:n_closed], percentages[:n_closed]
+
+
+    def new_event_data(self, event_data, times=None, watermark=None):
+        """
+        Receive new event_data json and pass it along to the correct device object.
+        Buckets are not closed here, call tick() afterwards or from a timer.
+
+        Parameters
+        ----------
+        event_data : dictionary
+            Data json containing new event data.
+        times : tuple
+            Already parsed update timestamp, update unixtime, timestamp and unixtime of event.
+            Parsed from event_data if None.
+        watermark : int
+            Newest event unixtime seen up to and including this event, as already advanced
+            by the caller. The event time watermark is advanced with this event if None.
+
+        Returns
+        -------
+        role : str
+            'desk' or 'reference' if event was served, None if it was ignored or a duplicate.
+
+        """
+
+        # get id of source sensor
+        source_id = os.path.basename(event_data['targetName'])
+
+        # verify temperature event
+        if 'temperature' not in event_data['data'].keys():
+            return None
+
+        # parse times once for all consumers
+        if times is None:
+            times = hlp.convert_event_data_timestamp(event_data['data']['temperature']['updateTime']) \
+                  + hlp.convert_event_data_timestamp(event_data['timestamp'])
+        update_timestamp, update_unixtime, timestamp, unixtime = times
+
+        # drop retransmitted and replayed events
+        if self.knows(source_id) and self.dedup.is_duplicate(source_id, event_data, update_unixtime):
+            return None
+
+        # move event time forward
+        if watermark is None:
+            self.schedule.advance(update_unixtime)
+            watermark = self.schedule.watermark
+
+        # update occupancy stats, opening new buckets before the event is counted
+        hour = self.__occupancy(update_timestamp, update_unixtime, watermark)
+
+        # check if source device is known
+        if source_id in self.desks.keys():
+            # serve event to desk with reference of its zone
+            self.desks[source_id].new_event_data(event_data, self.zones.reference_value(source_id, self.reference.latest_value), timestamp, unixtime)
+            self.zones.update_desk(self.desks[source_id], hour, count=hour is not None)
+            return 'desk'
+
+        elif source_id in self.reference.devices.keys():
+            # serve new temperature value to reference
+            self.reference.new_event_data(event_data, source_id, timestamp, unixtime)
+            self.zones.new_reference_event(event_data, source_id, timestamp, unixtime)
+            return 'reference'
+
+        return None
+
+
+    def ingest(self, events):
+        """
+        Serve a batch of events in the given order.
+        Buckets due in event time are closed as soon as an event has moved past them.
+
+        Parameters
+        ----------
+        events : list
+            Event data jsons, sorted in time.
+
+        Returns
+        -------
+        n_served : int
+            Number of events served to a desk or reference.
+
+        """
+
+        n_served = 0
+        for event_data in events:
+            if self.new_event_data(event_data) is not None:
+                n_served += 1
+
+            # close buckets in event time order, keeping few of them open during long replays
+            if self.schedule.pending():
+                self.tick()
+
+        return n_served
+
+
+    def ingest_batch(self, events):
+        """
+        Serve a micro-batch of events in the given order, with the same result as ingest().
+        Timestamps of the whole batch are parsed in one vectorized call, the event time
+        watermark is computed for the whole batch at once and due buckets are closed
+        once, after the last event of the batch.
+
+        Parameters
+        ----------
+        events : list
+            Event data jsons, in arrival order.
+
+        Returns
+        -------
+        roles : list
+            'desk', 'reference' or None for each event in events.
+
+        """
+
+        # only temperature events are parsed, malformed ones are skipped as the stream does for single events
+        roles = [None] * len(events)
+        index = []
+        for i, event_data in enumerate(events):
+            if 'temperature' not in event_data.get('data', {}):
+                continue
+            if 'targetName' in event_data and 'timestamp' in event_data and 'updateTime' in event_data['data']['temperature']:
+                index.append(i)
+            else:
+                logger.warning('Error in event package. Skipping...', extra={'event': event_data})
+        if len(index) == 0:
+            return roles
+
+        update_timestamps, update_unixtimes = hlp.convert_event_data_timestamps([events[i]['data']['temperature']['updateTime'] for i in index])
+        timestamps, unixtimes = hlp.convert_event_data_timestamps([events[i]['timestamp'] for i in index])
+
+        # watermark as seen by each event, lateness is judged as if events came one by one
+        watermarks = np.maximum.accumulate(np.asarray(update_unixtimes, dtype=np.int64))
+        if self.schedule.watermark is not None:
+            watermarks = np.maximum(watermarks, self.schedule.watermark)
+
+        for k, i in enumerate(index):
+            try:
+                roles[i] = self.new_event_data(events[i], (update_timestamps[k], update_unixtimes[k], timestamps[k], unixtimes[k]), int(watermarks[k]))
+            except KeyError:
+                logger.warning('Error in event package. Skipping...', extra={'event': events[i]})
+
+        # advance event time and close due buckets once per batch
+        self.schedule.advance(int(watermarks[-1]))
+        self.tick()
+
+        return roles
+
+
+    def results(self, path=()):
+        """
+        Current occupancy results of project or of one zone.
+
+        Parameters
+        ----------
+        path : tuple
+            Zone path, the empty path being the whole project.
+
+        Returns
+        -------
+        results : dictionary
+            Current state of each desk in zone and its hourly and daily occupancy series.
+
+        """
+
+        zone = self.zones.zone(path)
+        desks = {}
+        for device_id, desk_path in self.zones.desk_paths.items():
+            if desk_path[:len(zone.path)] == zone.path:
+                desk = self.desks[device_id]
+                desks[device_id] = desk.state[-1] if len(desk.state) > 0 else None
+
+        return {
+            'desks':                        desks,
+            'occupied_percentage':          zone.occupied_percentage(),
+            'hourly_occupancy_timestamp':   list(zone.hourly_occupancy_timestamp),
+            'hourly_occupancy_percentage':  list(zone.hourly_occupancy_percentage),
+            'daily_occupancy_timestamp':    list(zone.daily_occupancy_timestamp),
+            'daily_occupancy_percentage':   list(zone.daily_occupancy_percentage),
+        }
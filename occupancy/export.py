@@ -0,0 +1,236 @@
+# packages
+import os
+import csv
+import json
+import logging
+import datetime
+
+# optional columnar formats
+try:
+    import pyarrow         as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# project
+import occupancy.helpers as hlp
+from config.parameters   import params
+
+
+# module logger
+logger = logging.getLogger(__name__)
+
+# exported per-desk series in column order
+DESK_COLUMNS   = ['unixtime', 'temperature', 'diff', 'roc', 'roc_thrs', 'dsl_thrs', 'state']
+ROLLUP_COLUMNS = ['unixtime', 'percentage']
+
+# file extension per format
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': 'csv'}
+
+
+def _day(unixtime):
+    return datetime.datetime.utcfromtimestamp(unixtime).strftime('%Y-%m-%d')
+
+
+class SeriesExporter():
+    """
+    Incrementally exports per-desk series and occupancy rollups to disk.
+    Output is partitioned by project, device and day. New rows are buffered per
+    series and written once row_group_size rows are collected or their day has
+    closed, so each day ends up in few row-group-sized part files and memory use is
+    bounded by the buffer, not by the length of history. The last written unixtime
+    per series is kept in a manifest so that an interrupted export resumes where it stopped.
+
+    """
+
+    def __init__(self, root, project_id, fmt=None):
+        # fall back to csv without pyarrow
+        fmt = params['export']['format'] if fmt is None else fmt
+        if fmt != 'csv' and pa is None:
+            logger.warning('-- pyarrow not installed, exporting %s as csv', fmt)
+            fmt = 'csv'
+
+        # add to self
+        self.fmt  = fmt
+        self.root = os.path.join(root, 'project={}'.format(project_id))
+
+        # load cursors from previous runs
+        self.manifest_path = os.path.join(self.root, '_manifest.json')
+        self.cursors = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.cursors = json.load(f)
+
+        # key -> (object holding series, index of first row not yet buffered counted from the first row it ever held)
+        self.taken = {}
+
+        # key -> (partition, columns, buffered rows as list of tuples)
+        self.buffers = {}
+
+
+    def __write_part(self, partition, columns, rows):
+        """
+        Write rows of one day to a part file within partition.
+
+        Parameters
+        ----------
+        partition : str
+            Partition directory relative to project root.
+        columns : list
+            Column names.
+        rows : list
+            Row tuples of the same day, unixtime sorted ascending.
+
+        """
+
+        # part files are named by first unixtime, a resumed export overwrites rather than duplicates
+        directory = os.path.join(self.root, partition, 'day={}'.format(_day(rows[0][0])))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'part-{}.{}'.format(rows[0][0], EXTENSIONS[self.fmt]))
+
+        if self.fmt == 'csv':
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(rows)
+        else:
+            table = pa.table({column: list(values) for column, values in zip(columns, zip(*rows))})
+            if self.fmt == 'parquet':
+                pq.write_table(table, path, row_group_size=params['export']['row_group_size'])
+            else:
+                with pa.ipc.new_file(path, table.schema) as writer:
+                    writer.write_table(table)
+
+
+    def __flush(self, key, force):
+        """
+        Write buffered rows of closed days and full row groups of the newest day.
+
+        Parameters
+        ----------
+        key : str
+            Manifest key of series.
+        force : bool
+            Also write the remaining rows of the newest day.
+
+        """
+
+        partition, columns, rows = self.buffers[key]
+        if len(rows) == 0:
+            return
+
+        # out of order samples are sorted into their day
+        rows.sort(key=lambda row: row[0])
+        newest_day = _day(rows[-1][0])
+        chunk_size = params['export']['row_group_size']
+
+        # group by day, rows are sorted so each day is one run
+        days = [_day(row[0]) for row in rows]
+        kept = []
+        start = 0
+        for i in range(1, len(rows)+1):
+            if i < len(rows) and days[i] == days[start]:
+                continue
+            day_rows = rows[start:i]
+            start = i
+
+            # the newest day stays open, only full row groups of it are written
+            n_write = len(day_rows)
+            if days[i-1] == newest_day and not force:
+                n_write -= n_write % chunk_size
+            for j in range(0, n_write, chunk_size):
+                self.__write_part(partition, columns, day_rows[j:j+chunk_size])
+            kept += day_rows[n_write:]
+
+            # advance cursor only after part is on disk
+            if n_write > 0:
+                self.cursors[key] = max(self.cursors.get(key, -1), day_rows[n_write-1][0])
+                hlp.write_json_atomic(self.manifest_path, self.cursors)
+
+        self.buffers[key] = (partition, columns, kept)
+
+
+    def __export_series(self, key, partition, columns, series, source, offset=0, force=False):
+        """
+        Buffer all rows of series not yet taken and write those that are complete.
+
+        Parameters
+        ----------
+        key : str
+            Manifest key of series.
+        partition : str
+            Partition directory relative to project root.
+        columns : list
+            Column names, first one being unixtime.
+        series : dictionary
+            Column name -> list of values in the order rows were added.
+        source : object
+            Desk or Engine holding series, a new object starts counting rows anew.
+        offset : int
+            Number of rows dropped from the start of series since it was first exported.
+        force : bool
+            Write all buffered rows, also those of the newest day.
+
+        """
+
+        n = len(series['unixtime'])
+        if key not in self.taken or self.taken[key][0] is not source:
+            # first export of this series, rows up to the manifest cursor were written before
+            cursor = self.cursors.get(key, -1)
+            index = [i for i in range(n) if series['unixtime'][i] > cursor]
+        else:
+            # rows are appended in arrival order, which need not be time order
+            index = range(max(0, self.taken[key][1] - offset), n)
+        self.taken[key] = (source, offset + n)
+
+        # buffer new rows one row group at a time, so at most about one row group per series is held
+        chunk_size = params['export']['row_group_size']
+        self.buffers.setdefault(key, (partition, columns, []))
+        for start in range(0, len(index), chunk_size):
+            _, _, rows = self.buffers[key]
+            rows += [tuple(self.__value(series[column][i]) for column in columns) for i in index[start:start+chunk_size]]
+            self.__flush(key, False)
+
+        self.__flush(key, force)
+
+
+    @staticmethod
+    def __value(v):
+        # numpy scalars to plain python
+        return v.item() if hasattr(v, 'item') else v
+
+
+    def export(self, engine, force=False):
+        """
+        Export everything added since last export.
+        Rows of the current day are held back until the day closes or a row group is full.
+
+        Parameters
+        ----------
+        engine : Engine
+            Object holding desks and occupancy rollups.
+        force : bool
+            Write all buffered rows, for example before shutdown.
+
+        """
+
+        # per-desk series
+        for device_id, desk in engine.desks.items():
+            series = {column: getattr(desk, column) for column in DESK_COLUMNS}
+            self.__export_series(device_id, 'device={}'.format(device_id), DESK_COLUMNS, series, desk, desk.n_trimmed, force)
+
+        # closed rollup buckets only, open ones are still being filled
+        for name in ['hourly', 'daily']:
+            timestamps, percentages = engine.closed_buckets(name)
+            series = {
+                'unixtime':   [int(t.timestamp()) for t in timestamps],
+                'percentage': [None if p is None else float(p) for p in percentages],
+            }
+            self.__export_series('_' + name, 'rollup={}'.format(name), ROLLUP_COLUMNS, series, engine, force=force)
+
+        # removed desks, their last rows are written once forced
+        for key in [key for key in self.taken if not key.startswith('_') and key not in engine.desks]:
+            if force:
+                self.__flush(key, force)
+                del self.buffers[key]
+                del self.taken[key]
@@ -1,8 +1,18 @@
 # packages
+import os
 import sys
+import json
+import logging
 import numpy  as np
 import pandas as pd
 
+# project
+import occupancy.log   as log
+from config.parameters import params
+
+# module logger
+logger = logging.getLogger(__name__)
+
 
 def convert_event_data_timestamp(ts):
     """
@@ -28,6 +38,30 @@ def convert_event_data_timestamp(ts):
     return timestamp, unixtime
 
 
+def convert_event_data_timestamps(ts):
+    """
+    Convert a list of event_data timestamps in one vectorized call.
+    Gives the same values as convert_event_data_timestamp on each element.
+
+    Parameters
+    ----------
+    ts : list
+        UTC timestamps in custom API event data format.
+
+    Returns
+    -------
+    timestamps : list
+        Pandas Timestamp objects.
+    unixtimes : ndarray
+        Integer numbers of seconds since 1 January 1970.
+
+    """
+
+    index = pd.to_datetime(ts)
+
+    return list(index), index.asi8 // 10**9
+
+
 def temperature_roc_per_minute(dt, dy):
     """
     Convert a delta time and delta temperature to rate of change in deg/min.
@@ -51,7 +85,7 @@ def temperature_roc_per_minute(dt, dy):
 
 def print_error(text, terminate=True):
     """
-    Print an error message and terminate as desired.
+    Log an error message and terminate as desired.
 
     Parameters
     ----------
@@ -59,14 +93,16 @@ def print_error(text, terminate=True):
         Terminate execution if True.
     """
 
-    print('ERROR: {}'.format(text))
+    logger.error('ERROR: %s', text)
     if terminate:
+        # write queued records before exiting
+        log.shutdown()
         sys.exit()
 
 
 def loop_progress(i_track, i, n_max, n_steps, name=None, acronym=' '):
     """
-    Print loop progress to console.
+    Log loop progress.
 
     Parameters
     ----------
@@ -86,19 +122,19 @@ def loop_progress(i_track, i, n_max, n_steps, name=None, acronym=' '):
 
     if i_track == 0:
         # print empty bar
-        print('    |')
+        logger.info('    |')
         if name is None:
-            print('    └── Progress:')
+            logger.info('    └── Progress:')
         else:
-            print('    └── {}:'.format(name))
-        print('        ├── [ ' + (n_steps-1)*'-' + ' ] ' + acronym)
+            logger.info('    └── %s:', name)
+        logger.info('        ├── [ ' + (n_steps-1)*'-' + ' ] ' + acronym)
         i_track = 1
     elif i > i_track + part:
         # update tracker
         i_track = i_track + part
 
         # print bar
-        print('        ├── [ ' + int(i_track/part)*'#' + (n_steps - int(i_track/part) - 1)*'-' + ' ] ' + acronym)
+        logger.info('        ├── [ ' + int(i_track/part)*'#' + (n_steps - int(i_track/part) - 1)*'-' + ' ] ' + acronym)
 
     # return tracker
     return i_track
@@ -124,3 +160,154 @@ def json_sort_key(json):
     _, unixtime = convert_event_data_timestamp(timestamp)
     return unixtime
 
+
+
+def last_index(values, value):
+    """
+    Return index of last occurrence of value in list, None if not present.
+    Searches from the end as the wanted element is usually one of the last.
+
+    """
+
+    for i in range(len(values)-1, -1, -1):
+        if values[i] == value:
+            return i
+    return None
+
+
+def write_json_atomic(path, document):
+    """
+    Write document as json through a temporary file and rename it into place,
+    so a crash never leaves a partially written file behind.
+
+    Parameters
+    ----------
+    path : str
+        Destination file path.
+    document : object
+        JSON serializable document.
+
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(document, f)
+    os.replace(tmp_path, path)
+
+
+def latest_closed(percentages):
+    """
+    Return the most recent percentage of a closed bucket, None if none exists.
+    Open buckets have no percentage yet.
+
+    """
+
+    for p in reversed(percentages):
+        if p is not None:
+            return float(p)
+    return None
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Select indices of a series downsampled by Largest-Triangle-Three-Buckets.
+    Keeps the visual shape of a line, including peaks and edges, with far fewer points.
+
+    Parameters
+    ----------
+    x : array_like
+        Monotonically increasing sample positions.
+    y : array_like
+        Sample values. NaN values are never preferred over finite ones.
+    n_out : int
+        Number of points to keep.
+
+    Returns
+    -------
+    indices : ndarray
+        Sorted indices of kept samples, always including the first and last.
+
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+
+    # nothing to gain
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # bucket edges for the n_out-2 inner buckets
+    edges = np.linspace(1, n-1, n_out-1).astype(int)
+
+    # average point of the bucket after each inner bucket, the last point after the final one,
+    # all computed at once and ignoring NaN values
+    starts = edges[1:]
+    counts = np.r_[edges[2:], n] - starts
+    finite = np.isfinite(y)
+    n_finite = np.add.reduceat(finite.astype(int), starts)
+    cx = np.add.reduceat(x, starts) / counts
+    cy = np.where(n_finite > 0, np.add.reduceat(np.where(finite, y, 0), starts) / np.maximum(n_finite, 1), 0)
+
+    # pick point in each bucket spanning the largest triangle with the previous pick,
+    # plain python over lists as buckets hold only a few points each
+    xs, ys, cxs, cys, bounds = x.tolist(), y.tolist(), cx.tolist(), cy.tolist(), edges.tolist()
+    indices = np.zeros(n_out, dtype=int)
+    indices[-1] = n-1
+    a = 0
+    for i in range(n_out-2):
+        xa, ya = xs[a], ys[a]
+        best, best_area = bounds[i], -1.0
+        for j in range(bounds[i], bounds[i+1]):
+            # NaN areas never compare greater
+            area = abs((xa - cxs[i]) * (ys[j] - ya) - (xa - xs[j]) * (cys[i] - ya))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        indices[i+1] = a
+
+    return indices
+
+
+def working_hours_median(hourly_timestamp, hourly_percentage, day, working_hours=None):
+    """
+    Median of the hourly occupancy percentages within working hours of one day.
+
+    Parameters
+    ----------
+    hourly_timestamp : list
+        Hour timestamps in ascending order.
+    hourly_percentage : list
+        Occupancy percentage of each hour, None for hours without value.
+    day : datetime
+        Timestamp of midnight starting the day.
+    working_hours : list
+        First and last hour of working hours, params['occupancy']['working_hours'] if None.
+
+    Returns
+    -------
+    median : float
+        Median percentage, NaN if no hour within working hours has a value.
+
+    """
+
+    # set working hours
+    working_hours = params['occupancy']['working_hours'] if working_hours is None else working_hours
+    t1 = day + pd.Timedelta('{}h'.format(working_hours[0]))
+    t2 = day + pd.Timedelta('{}h'.format(working_hours[1]))
+
+    # iterate back in time 1 day
+    median_percentage = []
+    i = len(hourly_timestamp)
+    while i > 0 and hourly_timestamp[i-1] >= day:
+        # only use working hours
+        if hourly_timestamp[i-1] >= t1 and hourly_timestamp[i-1] <= t2 and hourly_percentage[i-1] is not None:
+            median_percentage.append(hourly_percentage[i-1])
+
+        # iterate
+        i -= 1
+
+    if len(median_percentage) == 0:
+        return np.nan
+    return np.median(median_percentage)
@@ -0,0 +1,222 @@
+# packages
+import math
+import numpy as np
+
+# optional accelerator
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# project
+from config.parameters import params as default_params
+
+
+def _recurrence(unixtime, diff, roc, roc_thrs, dsl_thrs, state, start, state_flag, run_start,
+                gamma_max, gamma_min, beta, alpha, window, lookback):
+    """
+    Run the desk occupancy state machine over samples start to end, in place.
+    Written so that it compiles unchanged with numba.njit, and runs as plain
+    Python on lists otherwise.
+
+    Parameters
+    ----------
+    unixtime, diff : sequence
+        Sample unixtimes and reference subtracted temperatures.
+    roc, roc_thrs, dsl_thrs, state : sequence
+        Output series, filled from index start on, earlier values are read as history.
+    start : int
+        First sample to compute, at least 1.
+    state_flag : bool
+        Occupancy flag after sample start-1.
+    run_start : int
+        Index of first sample of current occupied run, only used if state_flag.
+    gamma_max, gamma_min, beta, alpha : float
+        ROC threshold parameters.
+    window : bool
+        Average downslope threshold over at most lookback seconds of the run if True,
+        over the whole run otherwise.
+    lookback : int
+        [seconds] Averaging window length.
+
+    Returns
+    -------
+    state_flag : bool
+        Occupancy flag after last sample.
+    run_start : int
+        Index of first sample of current occupied run.
+    window_start : int
+        Index of first sample within averaging window.
+
+    """
+
+    # running sum over averaged part of current run
+    window_start = run_start
+    run_sum = 0.0
+    if state_flag:
+        for j in range(run_start, start):
+            run_sum += diff[j]
+
+    for i in range(start, len(unixtime)):
+        # rate of change in deg/min and dynamic roc threshold
+        roc[i] = max(0.0, (diff[i] - diff[i-1]) / (unixtime[i] - unixtime[i-1]) * 60)
+        thrs = min(gamma_max, roc_thrs[i-1] + beta)
+        roc_thrs[i] = max(gamma_min, thrs - roc[i] * alpha)
+
+        if not state_flag:
+            # check wether or not roc_thrs has been passed
+            if roc[i] >= roc_thrs[i]:
+                state[i] = 1
+                state_flag = True
+                run_start = i
+                window_start = i
+                run_sum = diff[i]
+
+        else:
+            # check wether or not temperature is below threshold
+            if diff[i] < dsl_thrs[i-1]:
+                state_flag = False
+            else:
+                state[i] = 1
+                run_sum += diff[i]
+
+                # evict samples older than lookback, the latest sample always stays
+                if window:
+                    while unixtime[window_start] < unixtime[i] - lookback:
+                        run_sum -= diff[window_start]
+                        window_start += 1
+                dsl_thrs[i] = run_sum / (i - window_start + 1)
+
+    return state_flag, run_start, window_start
+
+
+# available backends, the same source compiled when numba is installed
+KERNELS = {'python': _recurrence}
+if numba is not None:
+    KERNELS['numba'] = numba.njit(cache=True)(_recurrence)
+
+
+def backend_name(backend=None, params=None):
+    """
+    Resolve backend name, 'auto' picking numba when installed.
+
+    Parameters
+    ----------
+    backend : str
+        'auto', 'numba' or 'python', params['kernel']['backend'] if None.
+    params : dictionary
+        Algorithm parameters, config.parameters.params if None.
+
+    Returns
+    -------
+    name : str
+        Name of an available backend.
+
+    """
+
+    params  = default_params if params is None else params
+    backend = params['kernel']['backend'] if backend is None else backend
+    if backend == 'auto':
+        return 'numba' if 'numba' in KERNELS else 'python'
+    if backend not in KERNELS:
+        raise ValueError('Kernel backend {} not available, choose from {}.'.format(backend, list(KERNELS)))
+    return backend
+
+
+def run(unixtime, diff, roc, roc_thrs, dsl_thrs, state, start=1, state_flag=False, run_start=0, backend=None, params=None):
+    """
+    Run the desk occupancy state machine over typed arrays with the selected backend.
+    Output arrays are filled in place from index start on.
+
+    Parameters
+    ----------
+    unixtime : ndarray
+        int64 sample unixtimes.
+    diff : ndarray
+        float64 reference subtracted temperatures.
+    roc, roc_thrs, dsl_thrs : ndarray
+        float64 output series, holding history before index start.
+    state : ndarray
+        int8 output state, holding history before index start.
+    start : int
+        First sample to compute, at least 1.
+    state_flag : bool
+        Occupancy flag after sample start-1.
+    run_start : int
+        Index of first sample of current occupied run.
+    backend : str
+        'auto', 'numba' or 'python', params['kernel']['backend'] if None.
+    params : dictionary
+        Algorithm parameters, config.parameters.params if None.
+
+    Returns
+    -------
+    state_flag : bool
+        Occupancy flag after last sample.
+    run_start : int
+        Index of first sample of current occupied run.
+    window_start : int
+        Index of first sample within averaging window.
+
+    """
+
+    params = default_params if params is None else params
+    name   = backend_name(backend, params)
+    config = (
+        float(params['roc']['gamma_max']),
+        float(params['roc']['gamma_min']),
+        float(params['roc']['beta']),
+        float(params['roc']['alpha']),
+        params['diff']['threshold_mode'] == 'window',
+        int(params['diff']['longest_avg_lookback']),
+    )
+
+    # numba works on the arrays directly, plain python is faster on lists
+    if name == 'numba':
+        return KERNELS[name](unixtime, diff, roc, roc_thrs, dsl_thrs, state, int(start), bool(state_flag), int(run_start), *config)
+
+    series = [a.tolist() for a in (roc, roc_thrs, dsl_thrs, state)]
+    result = KERNELS[name](unixtime.tolist(), diff.tolist(), *series, int(start), bool(state_flag), int(run_start), *config)
+    for a, s in zip((roc, roc_thrs, dsl_thrs, state), series):
+        a[start:] = s[start:]
+    return result
+
+
+def estimate(unixtime, diff, backend=None, params=None):
+    """
+    Estimate occupancy of one desk from scratch over its whole series.
+    Suited for re-estimating long archived series, for example from SeriesArchive.
+
+    Parameters
+    ----------
+    unixtime : array_like
+        Sample unixtimes, ascending.
+    diff : array_like
+        Reference subtracted temperatures.
+    backend : str
+        'auto', 'numba' or 'python', params['kernel']['backend'] if None.
+    params : dictionary
+        Algorithm parameters, config.parameters.params if None.
+
+    Returns
+    -------
+    series : dictionary
+        roc, roc_thrs, dsl_thrs and state arrays.
+
+    """
+
+    params   = default_params if params is None else params
+    unixtime = np.ascontiguousarray(unixtime, dtype=np.int64)
+    diff     = np.ascontiguousarray(diff,     dtype=np.float64)
+    n = len(unixtime)
+
+    series = {
+        'roc':      np.zeros(n),
+        'roc_thrs': np.full(n, float(params['roc']['gamma_max'])),
+        'dsl_thrs': np.full(n, math.nan),
+        'state':    np.zeros(n, dtype=np.int8),
+    }
+    if n > 1:
+        run(unixtime, diff, series['roc'], series['roc_thrs'], series['dsl_thrs'], series['state'], backend=backend, params=params)
+
+    return series
@@ -0,0 +1,267 @@
+# packages
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# project
+from config.parameters import params
+
+
+# attributes present on every record, anything else was passed as extra
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+# package root logger
+logger = logging.getLogger('occupancy')
+
+# background writer and queue handler, set by setup()
+_listener = None
+_handler  = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line, including any extra fields.
+
+    """
+
+    def format(self, record):
+        document = {
+            'time':    record.created,
+            'level':   record.levelname,
+            'logger':  record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                document[key] = value
+
+        return json.dumps(document, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the caller.
+    Records are dropped and counted when the bounded queue is full.
+
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.n_dropped = 0
+
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.n_dropped += 1
+
+
+def _output(json_lines):
+    # plain text or JSON lines on stdout
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if json_lines else logging.Formatter('%(message)s'))
+    return output
+
+
+def setup(level='INFO', json_lines=False):
+    """
+    Route package logging through a bounded queue to a background writer thread.
+
+    Parameters
+    ----------
+    level : str
+        Minimum level to emit, for example 'DEBUG' or 'WARNING'.
+    json_lines : bool
+        Write JSON lines instead of plain text if True.
+
+    """
+
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+
+    # callers only put on queue
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=params['logging']['queue_size']))
+    logger.handlers = [_handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    # writer thread owns stdout
+    _listener = logging.handlers.QueueListener(_handler.queue, _output(json_lines))
+    _listener.start()
+
+
+def setup_worker(level='INFO', json_lines=False):
+    """
+    Write package logging directly to stdout, for pool worker processes.
+    A forked worker inherits the queue handler but not the writer thread draining
+    it, and exits without running exit handlers, so it writes its records itself.
+
+    Parameters
+    ----------
+    level : str
+        Minimum level to emit, for example 'DEBUG' or 'WARNING'.
+    json_lines : bool
+        Write JSON lines instead of plain text if True.
+
+    """
+
+    global _listener, _handler
+    _listener = None
+    _handler  = None
+
+    logger.handlers = [_output(json_lines)]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+def dropped():
+    """
+    Return number of records dropped so far because the queue was full.
+
+    """
+
+    return 0 if _handler is None else _handler.n_dropped
+
+
+def shutdown():
+    """
+    Write remaining queued records and stop the writer thread.
+
+    """
+
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# flush queued records at exit
+atexit.register(shutdown)
+
+
+class EventAggregator():
+    """
+    Summarizes the event path instead of logging every event.
+    Each event is logged at DEBUG level only, and at most once per interval
+    a single INFO record reports how many events came from how many devices,
+    and how many log records were dropped. Once started, a timer thread emits
+    the summary of an interval even if no further event arrives.
+
+    """
+
+    def __init__(self, interval=None):
+        # add to self
+        self.interval = params['logging']['aggregate_interval'] if interval is None else interval
+
+        # guards counts against the timer thread
+        self.lock    = threading.Lock()
+        self.stopped = threading.Event()
+
+        # dropped records already reported
+        self.n_dropped = dropped()
+        self.__reset(time.time())
+
+
+    def __reset(self, now):
+        self.t_start  = now
+        self.n_events = 0
+        self.sources  = {'desk': set(), 'reference': set()}
+
+
+    def __emit(self, now):
+        """
+        Log summary of interval, if anything happened, and start a new interval.
+        Called with lock held.
+
+        """
+
+        n_dropped = dropped() - self.n_dropped
+        if self.n_events > 0 or n_dropped > 0:
+            before = dropped()
+            logger.info(
+                '-- %d events from %d desks and %d references in the last %d s' + (', %d log records dropped' if n_dropped > 0 else ''),
+                self.n_events, len(self.sources['desk']), len(self.sources['reference']), now - self.t_start,
+                *([n_dropped] if n_dropped > 0 else []),
+                extra={'events': self.n_events, 'desks': len(self.sources['desk']), 'references': len(self.sources['reference']), 'dropped': n_dropped},
+            )
+
+            # a summary dropped itself leaves its count for the next one
+            if dropped() == before:
+                self.n_dropped = before
+
+        self.__reset(now)
+
+
+    def add(self, device_id, role):
+        """
+        Count one served event and emit a summary if interval has passed.
+
+        Parameters
+        ----------
+        device_id : str
+            Identifier of source device.
+        role : str
+            'desk' or 'reference'.
+
+        """
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('-- %-30s%s', device_id, role)
+
+        with self.lock:
+            self.n_events += 1
+            self.sources[role].add(device_id)
+
+            now = time.time()
+            if now - self.t_start >= self.interval:
+                self.__emit(now)
+
+
+    def flush(self):
+        """
+        Emit summary of the current, possibly incomplete, interval.
+
+        """
+
+        with self.lock:
+            self.__emit(time.time())
+
+
+    def start(self):
+        """
+        Emit summaries on a timer thread, also when no events arrive.
+
+        """
+
+        threading.Thread(target=self.__run, daemon=True).start()
+
+
+    def __run(self):
+        while True:
+            # sleep until end of current interval
+            with self.lock:
+                remaining = self.t_start + self.interval - time.time()
+            if self.stopped.wait(max(0, remaining)):
+                return
+
+            with self.lock:
+                now = time.time()
+                if now - self.t_start >= self.interval:
+                    self.__emit(now)
+
+
+    def stop(self):
+        """
+        Stop timer thread and emit summary of the last interval.
+
+        """
+
+        self.stopped.set()
+        self.flush()
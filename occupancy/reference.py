@@ -51,7 +51,24 @@ class Reference():
         self.latest_values[device_id] = None
 
 
-    def new_event_data(self, event_data, device_id):
+    def remove_device(self, device_id):
+        """
+        Remove device so that it no longer contributes to the reference value.
+
+        Parameters
+        ----------
+        device_id : str
+            Device identifier.
+
+        """
+
+        # forget device and its latest value
+        del self.devices[device_id]
+        del self.latest_values[device_id]
+        self.n_devices -= 1
+
+
+    def new_event_data(self, event_data, device_id, timestamp=None, unixtime=None):
         """
         Receive new event data json from Director and update reference value.
 
@@ -61,12 +78,17 @@ class Reference():
             Data json containing new event data.
         device_id : str
             Identifier of source device.
+        timestamp : datetime
+            Already parsed event timestamp, parsed from event_data if None.
+        unixtime : int
+            Already parsed event unixtime, parsed from event_data if None.
 
         """
 
         # isolate timestamp and temperature value
         temperature = event_data['data']['temperature']['value']
-        timestamp, unixtime = helpers.convert_event_data_timestamp(event_data['timestamp'])
+        if timestamp is None:
+            timestamp, unixtime = helpers.convert_event_data_timestamp(event_data['timestamp'])
 
         # append to lists
         self.devices[device_id]['timestamp'].append(timestamp)
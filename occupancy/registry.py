@@ -0,0 +1,114 @@
+# packages
+import os
+import copy
+import time
+
+
+def device_kind(device):
+    """
+    Classify a device json as desk or reference sensor.
+
+    Parameters
+    ----------
+    device : dictionary
+        Device information json in dictionary format.
+
+    Returns
+    -------
+    kind : str
+        Either 'desk' or 'reference'. None if device is not a temperature sensor.
+
+    """
+
+    # only temperature sensors take part in the estimation
+    if device['type'] != 'temperature':
+        return None
+
+    # reference label decides role
+    if 'reference' in device['labels'].keys():
+        return 'reference'
+    return 'desk'
+
+
+class DeviceRegistry():
+    """
+    Cached registry of the temperature sensors in a project.
+    Each refresh is diffed against the cache so that only devices
+    which were added, removed or reclassified have to be acted upon.
+
+    """
+
+    def __init__(self):
+        # initialise dictionaries
+        self.devices = {}   # device_id -> cached device json
+        self.kinds   = {}   # device_id -> 'desk' or 'reference'
+
+        # unixtime of last refresh
+        self.last_refresh = None
+
+
+    def update(self, devices):
+        """
+        Replace cached device list and return the difference to previous state.
+
+        Parameters
+        ----------
+        devices : list
+            Complete list of device information jsons in project.
+
+        Returns
+        -------
+        added : list
+            Identifiers of devices not previously known.
+        removed : list
+            Identifiers of devices no longer in project.
+        reclassified : list
+            Identifiers of devices that changed between desk and reference.
+        relabeled : list
+            Identifiers of devices with changed labels but unchanged role.
+
+        """
+
+        # classify new listing
+        listing = {}
+        for device in devices:
+            kind = device_kind(device)
+            if kind is not None:
+                listing[os.path.basename(device['name'])] = (device, kind)
+
+        # diff against cache
+        added        = [device_id for device_id in listing if device_id not in self.kinds]
+        removed      = [device_id for device_id in self.kinds if device_id not in listing]
+        reclassified = [device_id for device_id in listing if device_id in self.kinds and self.kinds[device_id] != listing[device_id][1]]
+        relabeled    = [device_id for device_id in listing if device_id in self.kinds and device_id not in reclassified
+                        and self.devices[device_id]['labels'] != listing[device_id][0]['labels']]
+
+        # replace cache with copies as device objects are mutated downstream
+        self.devices = {device_id: copy.deepcopy(listing[device_id][0]) for device_id in listing}
+        self.kinds   = {device_id: listing[device_id][1] for device_id in listing}
+
+        # timestamp refresh
+        self.last_refresh = time.time()
+
+        return added, removed, reclassified, relabeled
+
+
+    def seconds_since_refresh(self):
+        """
+        Return seconds since last refresh, infinite if never refreshed.
+
+        """
+
+        if self.last_refresh is None:
+            return float('inf')
+        return time.time() - self.last_refresh
+
+
+    def touch(self):
+        """
+        Restart time since last refresh without changing the cache.
+        Used after a failed refresh so that it is not retried on every event.
+
+        """
+
+        self.last_refresh = time.time()
@@ -0,0 +1,466 @@
+# packages
+import time
+import bisect
+import collections
+import logging
+import numpy  as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# project
+import occupancy.helpers as hlp
+import occupancy.log     as log
+from occupancy.api       import fetch_event_history
+from occupancy.engine    import Engine
+from config.parameters   import params as default_params
+
+
+# module logger
+logger = logging.getLogger(__name__)
+
+# time format of API filters
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def split_range(starttime, endtime, n_chunks):
+    """
+    Split a time range into at most n_chunks chunks with seams at UTC midnight.
+    Seams on day boundaries keep every hourly and daily bucket within one chunk.
+
+    Parameters
+    ----------
+    starttime : str
+        UTC starttime [YYYY-MM-DDTHH:MM:SSZ].
+    endtime : str
+        UTC endtime [YYYY-MM-DDTHH:MM:SSZ].
+    n_chunks : int
+        Requested number of chunks.
+
+    Returns
+    -------
+    chunks : list
+        (start, end) pandas timestamp pairs, end exclusive except for the last chunk.
+
+    """
+
+    t0 = pd.Timestamp(starttime)
+    t1 = pd.Timestamp(endtime)
+
+    # midnights strictly inside range
+    midnights = pd.date_range(t0.floor('D') + pd.Timedelta('1D'), t1, freq='D')
+    midnights = [m for m in midnights if t0 < m < t1]
+
+    # spread seams evenly over available midnights
+    n_seams = min(n_chunks, len(midnights)+1) - 1
+    picks = sorted(set(int(round(x)) for x in np.linspace(0, len(midnights)-1, n_seams))) if n_seams > 0 else []
+    bounds = [t0] + [midnights[i] for i in picks] + [t1]
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _replay_chunk(job):
+    """
+    Fetch and replay the events of one chunk, starting from a warm-up window.
+    Runs in a worker process.
+
+    Parameters
+    ----------
+    job : dictionary
+        API credentials, devices, chunk boundaries and arguments.
+
+    Returns
+    -------
+    engine : Engine
+        Engine holding the replayed chunk, warm-up samples included.
+
+    """
+
+    start, end = job['chunk']
+    history_params = dict(job['history_params'])
+
+    # the first chunk starts at the requested starttime like a sequential replay
+    warmup = 0 if job['first'] else job['params']['replay']['warmup']
+    history_params['start_time'] = (start - pd.Timedelta(seconds=warmup)).strftime(TIME_FORMAT)
+    history_params['end_time']   = end.strftime(TIME_FORMAT)
+
+    events = fetch_event_history(job['api_url_base'], job['project_id'], job['auth'], job['devices'], history_params)
+
+    # the next chunk owns events from its start on
+    if not job['last']:
+        t_end = end.timestamp()
+        events = [e for e in events if hlp.json_sort_key(e) < t_end]
+
+    # duplicates and late events of the warm-up window are counted by the previous chunk
+    engine = Engine(job['devices'], job['args'], job['params'])
+    n_warmup = bisect.bisect_left([hlp.json_sort_key(e) for e in events], start.timestamp())
+    engine.ingest(events[:n_warmup])
+    engine.dedup.suppressed = 0
+    engine.dedup.n_suppressed.clear()
+    engine.n_late = 0
+    engine.ingest(events[n_warmup:])
+
+    # no later events will close the last buckets of this chunk
+    if not job['last']:
+        engine.flush()
+
+    return engine
+
+
+def _since(unixtime, t):
+    # index of first sample at or after unixtime t
+    return bisect.bisect_left(unixtime, t)
+
+
+def _stitch_desk(stitched, chunk, t_start, changed):
+    """
+    Continue a stitched desk with the samples of the next chunk.
+    If the algorithm state of the chunk disagrees with the stitched desk at the seam,
+    the chunk samples are replayed through the stitched desk in one call of the kernel.
+
+    Parameters
+    ----------
+    stitched : Desk
+        Desk holding all samples before the seam.
+    chunk : Desk
+        Same desk replayed in the next chunk, warm-up samples included.
+    t_start : int
+        Unixtime of seam.
+    changed : set
+        Unixtimes of hours in which reconciliation changed a state, updated in place.
+
+    Returns
+    -------
+    n_replayed : int
+        Number of samples replayed for reconciliation, 0 if the seam agreed.
+
+    """
+
+    i = _since(chunk.unixtime, t_start)
+    if i == len(chunk.unixtime):
+        return 0
+
+    # agreement at the seam, append chunk as is
+    if i > 0 and stitched.converged(chunk, i-1):
+        stitched.extend(chunk, i)
+        return 0
+
+    # reconcile by replaying all samples of the chunk with the kernel, in blocks of at most
+    # retain seconds so that trimming never drops samples before they are compared
+    retain = stitched.params['diff']['retain']
+    n_replayed = 0
+    while i < len(chunk.unixtime):
+        j = len(chunk.unixtime) if retain is None else bisect.bisect_right(chunk.unixtime, chunk.unixtime[i] + retain, lo=i+1)
+        stitched.append_samples(chunk.timestamp[i:j], chunk.unixtime[i:j], chunk.temperature[i:j], chunk.diff[i:j])
+
+        # hours in which replay changed a state
+        state = np.asarray(stitched.state[len(stitched.state)-(j-i):])
+        for t in np.asarray(chunk.unixtime[i:j])[state != np.asarray(chunk.state[i:j])]:
+            changed.add(int(t - t % 3600))
+        n_replayed += j - i
+        i = j
+
+    return n_replayed
+
+
+def _stitch_series(owners, chunks, keys):
+    """
+    Concatenate unixtime sorted series held by one object per chunk into the last one.
+
+    Parameters
+    ----------
+    owners : list
+        One object or dictionary per chunk holding the series.
+    chunks : list
+        (start, end) pairs of chunks.
+    keys : list
+        Names of series, one of them being unixtime.
+
+    """
+
+    def get(owner, key):
+        return owner[key] if isinstance(owner, dict) else getattr(owner, key)
+
+    stitched = {key: [] for key in keys}
+    for k, (owner, (start, end)) in enumerate(zip(owners, chunks)):
+        unixtime = get(owner, 'unixtime')
+        i = 0 if k == 0 else _since(unixtime, start.timestamp())
+        j = len(unixtime) if k == len(chunks)-1 else _since(unixtime, end.timestamp())
+        for key in keys:
+            stitched[key] += get(owner, key)[i:j]
+
+    for key in keys:
+        get(owners[-1], key)[:] = stitched[key]
+
+
+def _stitch_rollups(owners, chunks):
+    """
+    Concatenate hourly and daily occupancy of each chunk into the last one.
+    Buckets are taken from the chunk they fall in, warm-up buckets are dropped.
+
+    Parameters
+    ----------
+    owners : list
+        One Engine or Zone per chunk.
+    chunks : list
+        (start, end) pairs of chunks.
+
+    """
+
+    for name in ['hourly', 'daily']:
+        stitched_timestamp  = []
+        stitched_percentage = []
+        for k, (owner, (start, end)) in enumerate(zip(owners, chunks)):
+            timestamps  = getattr(owner, '{}_occupancy_timestamp'.format(name))
+            percentages = getattr(owner, '{}_occupancy_percentage'.format(name))
+            for t, p in zip(timestamps, percentages):
+                t_bucket = t.floor('D') if name == 'daily' else t
+                if (k == 0 or t_bucket >= start) and (k == len(chunks)-1 or t_bucket < end):
+                    stitched_timestamp.append(t)
+                    stitched_percentage.append(p)
+        getattr(owners[-1], '{}_occupancy_timestamp'.format(name))[:]  = stitched_timestamp
+        getattr(owners[-1], '{}_occupancy_percentage'.format(name))[:] = stitched_percentage
+
+
+def _recount(engine, hours):
+    """
+    Recompute hourly occupancy of the given hours, and daily occupancy of their days,
+    from the stitched desk states for the project and every zone.
+
+    Parameters
+    ----------
+    engine : Engine
+        Stitched engine.
+    hours : set
+        Unixtimes of hours to recompute.
+
+    """
+
+    if len(hours) == 0:
+        return
+
+    # desks occupied at some point within each hour
+    active = {hour: set() for hour in hours}
+    for device_id, desk in engine.desks.items():
+        unixtime = np.asarray(desk.unixtime)
+        state    = np.asarray(desk.state)
+        for hour in hours:
+            i, j = np.searchsorted(unixtime, [hour, hour+3600])
+            if np.any(state[i:j] == 1):
+                active[hour].add(device_id)
+
+    # project lists are owned by the engine, zone lists by each zone
+    owners = [(engine, engine.zones.root)] + [(zone, zone) for zone in engine.zones.nodes.values()]
+    days = set()
+    for owner, zone in owners:
+        if zone.n_desks == 0:
+            continue
+        for k, t in enumerate(owner.hourly_occupancy_timestamp):
+            hour = int(t.timestamp())
+            if hour in active:
+                n_active = sum(1 for device_id in active[hour] if engine.zones.desk_paths[device_id][:len(zone.path)] == zone.path)
+                owner.hourly_occupancy_percentage[k] = (n_active / zone.n_desks) * 100
+                days.add(t.floor('D'))
+
+    for owner, _ in owners:
+        for k, t in enumerate(owner.daily_occupancy_timestamp):
+            if t.floor('D') in days and owner.daily_occupancy_percentage[k] is not None:
+                owner.daily_occupancy_percentage[k] = hlp.working_hours_median(
+                    owner.hourly_occupancy_timestamp, owner.hourly_occupancy_percentage, t.floor('D'),
+                    engine.params['occupancy']['working_hours'])
+
+
+def stitch(engines, chunks):
+    """
+    Stitch the engines of consecutive chunks into one.
+    The engine of the last chunk is returned so that streaming can continue from it.
+
+    Parameters
+    ----------
+    engines : list
+        One Engine per chunk, in time order.
+    chunks : list
+        (start, end) pairs of chunks.
+
+    Returns
+    -------
+    engine : Engine
+        Stitched engine.
+    stats : dictionary
+        Number of seams per desk, seams that disagreed, samples replayed for reconciliation
+        and hours of occupancy recomputed.
+
+    """
+
+    final   = engines[-1]
+    stats   = {'seams': 0, 'disagreed': 0, 'replayed': 0}
+    changed = set()
+
+    # desks, starting from the first chunk that has seen the desk
+    for device_id in final.desks:
+        stitched = None
+        for engine, (start, _) in zip(engines, chunks):
+            desk = engine.desks.get(device_id)
+            if desk is None or len(desk.unixtime) == 0:
+                continue
+            if stitched is None:
+                stitched = desk
+                continue
+            n_replayed = _stitch_desk(stitched, desk, start.timestamp(), changed)
+            stats['seams']     += 1
+            stats['disagreed'] += n_replayed > 0
+            stats['replayed']  += n_replayed
+        if stitched is not None:
+            stitched.device = final.desks[device_id].device
+            final.desks[device_id] = stitched
+            final.zones.update_desk(stitched)
+
+    # reference series, project wide and per device
+    series = ['timestamp', 'unixtime', 'temperature']
+    _stitch_series([engine.reference for engine in engines], chunks, series)
+    for device_id in final.reference.devices:
+        _stitch_series([engine.reference.devices.get(device_id, {key: [] for key in series}) for engine in engines], chunks, series)
+
+    # rollups, project wide and per zone
+    _stitch_rollups(engines, chunks)
+    for path in final.zones.nodes:
+        pairs = [(engine.zones.nodes[path], chunk) for engine, chunk in zip(engines, chunks) if path in engine.zones.nodes]
+        _stitch_rollups(*map(list, zip(*pairs)))
+
+    # event counters of all chunks
+    final.dedup.suppressed   = sum(engine.dedup.suppressed for engine in engines)
+    final.dedup.n_suppressed = sum((engine.dedup.n_suppressed for engine in engines), collections.Counter())
+    final.n_late             = sum(engine.n_late for engine in engines)
+
+    # rollups of chunks were taken before reconciliation, correct hours it changed
+    _recount(final, changed)
+    stats['hours'] = len(changed)
+
+    return final, stats
+
+
+def replay_history(api_url_base, project_id, auth, devices, history_params, args, n_chunks, workers=None, params=None):
+    """
+    Replay event history in time chunks, one process per chunk, and stitch the results.
+
+    Parameters
+    ----------
+    api_url_base : str
+        Base url of the DT Developer API.
+    project_id : str
+        Identifier of project.
+    auth : tuple
+        Service account key and secret.
+    devices : list
+        Device information jsons.
+    history_params : dictionary
+        Event listing filters including start_time and end_time.
+    args : dictionary
+        Command line arguments.
+    n_chunks : int
+        Requested number of chunks.
+    workers : int
+        Number of processes, None for one per chunk.
+    params : dictionary
+        Algorithm parameters of the replayed engines, config.parameters.params if None.
+
+    Returns
+    -------
+    engine : Engine
+        Stitched engine.
+    stats : dictionary
+        Seam statistics of stitch().
+
+    """
+
+    chunks = split_range(history_params['start_time'], history_params['end_time'], n_chunks)
+    jobs = [{
+        'api_url_base':   api_url_base,
+        'project_id':     project_id,
+        'auth':           auth,
+        'devices':        list(devices),
+        'history_params': history_params,
+        'args':           args,
+        'params':         params if params is not None else default_params,
+        'chunk':          chunk,
+        'first':          k == 0,
+        'last':           k == len(chunks)-1,
+    } for k, chunk in enumerate(chunks)]
+
+    logger.info('-- Replaying history in %d chunks', len(chunks))
+    # workers log directly, the writer thread of this process is not inherited
+    initargs = (args.get('loglevel', 'INFO'), args.get('jsonlog', False))
+    with ProcessPoolExecutor(max_workers=workers or len(chunks), initializer=log.setup_worker, initargs=initargs) as pool:
+        engines = list(pool.map(_replay_chunk, jobs))
+
+    return stitch(engines, chunks)
+
+
+def disagreement(engine_a, engine_b):
+    """
+    Count desk samples for which two engines estimated a different state.
+
+    Parameters
+    ----------
+    engine_a : Engine
+        For example the stitched engine.
+    engine_b : Engine
+        For example the sequentially replayed engine.
+
+    Returns
+    -------
+    n_differ : int
+        Number of samples with a different state.
+    n_samples : int
+        Number of samples present in both engines.
+
+    """
+
+    n_differ  = 0
+    n_samples = 0
+    for device_id, desk_a in engine_a.desks.items():
+        desk_b = engine_b.desks.get(device_id)
+        if desk_b is None:
+            continue
+        _, ia, ib = np.intersect1d(desk_a.unixtime, desk_b.unixtime, assume_unique=True, return_indices=True)
+        n_differ  += int(np.sum(np.asarray(desk_a.state)[ia] != np.asarray(desk_b.state)[ib]))
+        n_samples += len(ia)
+
+    return n_differ, n_samples
+
+
+def compare(replay, sequential):
+    """
+    Time a chunked and a sequential replay and measure how often they disagree.
+
+    Parameters
+    ----------
+    replay : callable
+        Returns (engine, stats) of a chunked replay.
+    sequential : callable
+        Returns the engine of a sequential replay.
+
+    Returns
+    -------
+    engine : Engine
+        Engine of the chunked replay.
+    stats : dictionary
+        Seam statistics extended by timings, speedup and disagreement.
+
+    """
+
+    t0 = time.perf_counter()
+    engine, stats = replay()
+    t1 = time.perf_counter()
+    reference = sequential()
+    t2 = time.perf_counter()
+
+    n_differ, n_samples = disagreement(engine, reference)
+    stats.update({
+        'chunked_seconds':    t1 - t0,
+        'sequential_seconds': t2 - t1,
+        'speedup':            (t2 - t1) / (t1 - t0) if t1 > t0 else float('inf'),
+        'samples':            n_samples,
+        'differ':             n_differ,
+    })
+
+    return engine, stats
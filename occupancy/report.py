@@ -0,0 +1,152 @@
+# packages
+import os
+import html
+import numpy as np
+from concurrent.futures  import ProcessPoolExecutor
+from matplotlib.figure   import Figure
+
+# project
+import config.styling    as stl
+from occupancy.helpers   import lttb_indices
+from config.parameters   import params
+
+
+def _downsample(unixtime, values, n_out):
+    """
+    Downsample one series with LTTB and convert time axis to datetime64.
+
+    Parameters
+    ----------
+    unixtime : array_like
+        Sample unixtimes.
+    values : array_like
+        Sample values.
+    n_out : int
+        Maximum number of points to keep.
+
+    Returns
+    -------
+    x : ndarray
+        Kept sample times as datetime64.
+    y : ndarray
+        Kept sample values.
+
+    """
+
+    unixtime = np.asarray(unixtime, dtype=np.int64)
+    values   = np.asarray(values,   dtype=float)
+    idx = lttb_indices(unixtime, values, n_out)
+
+    return unixtime[idx].astype('datetime64[s]'), values[idx]
+
+
+def _render_desk(job):
+    """
+    Render the four debug panels of one desk to file.
+    Runs in a worker process, downsamples the series there and draws on a bare
+    Figure, so no display or interactive backend is involved.
+
+    Parameters
+    ----------
+    job : dictionary
+        Desk identifier, output path, raw series and downsampled reference.
+
+    Returns
+    -------
+    path : str
+        Path of rendered file.
+
+    """
+
+    fig = Figure(figsize=params['report']['figsize'])
+    dax = fig.subplots(4, 1, sharex=False)
+    s   = {key: _downsample(job['unixtime'], values, params['report']['max_points']) for key, values in job['series'].items()}
+
+    dax[0].plot(*s['temperature'], '-', color=stl.NS[1], linewidth=stl.lw, label='Desk Temperature')
+    dax[0].plot(*job['reference'],  '-', color=stl.SS[1], linewidth=stl.lw, label='Reference Temperature')
+    dax[0].set_title(job['device_id'])
+    dax[0].set_xlabel('Timestamp')
+    dax[0].set_ylabel('Temperature [deg]')
+    dax[0].legend(loc='upper left')
+
+    dax[1].plot(*s['diff'],     '-', color=stl.NS[1], linewidth=stl.lw, label='Differenced Temperature')
+    dax[1].plot(*s['dsl_thrs'], '-', color=stl.SS[1], linewidth=stl.lw, label='Downslope Threshold')
+    dax[1].set_xlabel('Timestamp')
+    dax[1].set_ylabel('Temperature [deg]')
+    dax[1].legend(loc='upper left')
+
+    dax[2].plot(*s['roc'],      '-', color=stl.NS[1], linewidth=stl.lw, label='Rate of Change')
+    dax[2].plot(*s['roc_thrs'], '-', color=stl.SS[1], linewidth=stl.lw, label='Dynamic Threshold')
+    dax[2].set_xlabel('Timestamp')
+    dax[2].set_ylabel('Temperature [deg/min]')
+    dax[2].legend(loc='upper left')
+
+    x, y = s['state']
+    dax[3].fill_between(x, np.zeros(len(y)), y, alpha=0.75, color=stl.SS[1], label='Detected Occupancy')
+    dax[3].plot(x, y, '-', color=stl.NS[1], linewidth=stl.lw, label='No Occupancy')
+    dax[3].set_xlabel('Timestamp')
+    dax[3].set_ylabel('Binary')
+    dax[3].legend(loc='upper left')
+
+    fig.tight_layout()
+    fig.savefig(job['path'], dpi=params['report']['dpi'])
+
+    return job['path']
+
+
+def render_report(engine, directory):
+    """
+    Render debug panels for every desk in parallel and write an index page.
+
+    Parameters
+    ----------
+    engine : Engine
+        Object holding desks and reference.
+    directory : str
+        Output directory, created if missing.
+
+    Returns
+    -------
+    index_path : str
+        Path of the index HTML page.
+
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    n_out = params['report']['max_points']
+    fmt   = params['report']['format']
+
+    # reference is shared by all panels, downsample once
+    reference = _downsample(engine.reference.unixtime, engine.reference.temperature, n_out)
+
+    # series are downsampled by the workers, in parallel
+    jobs = []
+    for device_id, desk in engine.desks.items():
+        if len(desk.unixtime) == 0:
+            continue
+        jobs.append({
+            'device_id': device_id,
+            'path':      os.path.join(directory, '{}.{}'.format(device_id, fmt)),
+            'reference': reference,
+            'unixtime':  desk.unixtime,
+            'series':    {key: getattr(desk, key) for key in ['temperature', 'diff', 'dsl_thrs', 'roc', 'roc_thrs', 'state']},
+        })
+
+    # render in process pool
+    with ProcessPoolExecutor(max_workers=params['report']['workers']) as pool:
+        paths = list(pool.map(_render_desk, jobs))
+
+    # index page linking all figures
+    index_path = os.path.join(directory, 'index.html')
+    with open(index_path, 'w') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>Desk Occupancy Debug Report</title></head>\n<body>\n')
+        f.write('<h1>Desk Occupancy Debug Report</h1>\n<ul>\n')
+        for job in jobs:
+            f.write('<li><a href="#{0}">{0}</a></li>\n'.format(html.escape(job['device_id'])))
+        f.write('</ul>\n')
+        for job, path in zip(jobs, paths):
+            name = html.escape(job['device_id'])
+            f.write('<h2 id="{}">{}</h2>\n<img src="{}" alt="{}">\n'.format(name, name, html.escape(os.path.basename(path)), name))
+        f.write('</body>\n</html>\n')
+
+    return index_path
@@ -0,0 +1,112 @@
+# packages
+import heapq
+
+
+# buckets due at the same time close hours first, a day needs all of its hours
+ORDER = {'hour': 0, 'day': 1}
+
+
+class BucketScheduler():
+    """
+    Heap of closing deadlines for open hourly and daily buckets.
+    A bucket is due once its end plus the grace period has passed, either in event
+    time, as given by the newest event seen, or in wall-clock time, whichever is first.
+    Popping due buckets is O(log n) each and checking for none is O(1), so it is
+    cheap enough to check on every event.
+
+    """
+
+    def __init__(self, grace):
+        # add to self
+        self.grace = grace
+
+        # (deadline, order, kind, bucket start unixtime)
+        self.heap = []
+
+        # newest event unixtime seen
+        self.watermark = None
+
+
+    def add(self, kind, start, length):
+        """
+        Schedule closing of a newly opened bucket.
+
+        Parameters
+        ----------
+        kind : str
+            'hour' or 'day'.
+        start : int
+            Bucket start unixtime.
+        length : int
+            Bucket length in seconds.
+
+        """
+
+        heapq.heappush(self.heap, (start + length + self.grace, ORDER[kind], kind, start))
+
+
+    def advance(self, unixtime):
+        """
+        Move event time watermark forward, never backwards.
+
+        """
+
+        if self.watermark is None or unixtime > self.watermark:
+            self.watermark = unixtime
+
+
+    def is_due(self, start, length, watermark=None):
+        """
+        Return True if a bucket is due by event time watermark, the scheduler's own if None.
+
+        """
+
+        watermark = self.watermark if watermark is None else watermark
+        return watermark is not None and start + length + self.grace <= watermark
+
+
+    def pending(self):
+        """
+        Return True if any bucket is due by event time, O(1).
+
+        """
+
+        return len(self.heap) > 0 and self.watermark is not None and self.heap[0][0] <= self.watermark
+
+
+    def next_deadline(self):
+        """
+        Return earliest deadline, None if no bucket is open.
+
+        """
+
+        return self.heap[0][0] if len(self.heap) > 0 else None
+
+
+    def due(self, now=None):
+        """
+        Pop all buckets due by event time or by wall-clock time now.
+
+        Parameters
+        ----------
+        now : float
+            Wall-clock unixtime, only event time is used if None.
+
+        Returns
+        -------
+        buckets : list
+            (kind, bucket start unixtime) pairs in closing order.
+
+        """
+
+        t = self.watermark
+        if now is not None and (t is None or now > t):
+            t = now
+        if t is None:
+            return []
+
+        buckets = []
+        while len(self.heap) > 0 and self.heap[0][0] <= t:
+            _, _, kind, start = heapq.heappop(self.heap)
+            buckets.append((kind, start))
+        return buckets
@@ -0,0 +1,297 @@
+# packages
+import re
+import json
+import math
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# project
+import occupancy.helpers as hlp
+from config.parameters   import params
+
+
+def _finite(value):
+    """
+    Replace NaN and infinite values with None so they serialize as JSON null.
+
+    """
+
+    if value is None or math.isfinite(value):
+        return value
+    return None
+
+
+def _desk_summary(desk):
+    """
+    Current state and latest values of a single desk.
+
+    Parameters
+    ----------
+    desk : Desk
+        Desk object to summarize.
+
+    Returns
+    -------
+    summary : dictionary
+        Latest state, temperature and timestamp of desk.
+
+    """
+
+    if len(desk.unixtime) == 0:
+        return {'id': desk.device_id, 'state': None, 'temperature': None, 'diff': None, 'unixtime': None}
+
+    return {
+        'id':           desk.device_id,
+        'state':        int(desk.state[-1]),
+        'temperature':  _finite(float(desk.temperature[-1])),
+        'diff':         _finite(float(desk.diff[-1])),
+        'unixtime':     int(desk.unixtime[-1]),
+    }
+
+
+def _desk_series(desk, n):
+    """
+    Last n samples of all per-desk series.
+
+    Parameters
+    ----------
+    desk : Desk
+        Desk object to extract series from.
+    n : int
+        Number of samples to include.
+
+    Returns
+    -------
+    series : dictionary
+        Dictionary of lists with one entry per sample.
+
+    """
+
+    series = {'unixtime': [int(t) for t in desk.unixtime[-n:]]}
+    for key in ['temperature', 'diff', 'roc', 'roc_thrs', 'dsl_thrs']:
+        series[key] = [_finite(float(v)) for v in getattr(desk, key)[-n:]]
+    series['state'] = [int(v) for v in desk.state[-n:]]
+
+    return series
+
+
+def _rollup(timestamps, percentages):
+    """
+    Combine rollup timestamp and percentage lists into a JSON friendly form.
+
+    """
+
+    return {
+        'timestamp':  [t.isoformat() for t in timestamps],
+        'percentage': [None if p is None else _finite(float(p)) for p in percentages],
+    }
+
+
+def _desk_version(desk):
+    """
+    Key that changes whenever a sample is appended to desk, also once its history is trimmed.
+
+    """
+
+    n = len(desk.unixtime)
+    return (id(desk), n, desk.unixtime[-1] if n > 0 else None)
+
+
+def _serialize(document):
+    """
+    Serialize document and tag it with a content hash.
+
+    """
+
+    body = json.dumps(document).encode('utf-8')
+    return body, '"{}"'.format(hashlib.blake2b(body, digest_size=8).hexdigest())
+
+
+def _etag_matches(header, etag):
+    """
+    Check an If-None-Match header against an entity tag.
+    The header is '*' or a list of possibly weak tags, compared weakly as in RFC 9110 13.1.2.
+
+    Parameters
+    ----------
+    header : str
+        If-None-Match header value, None if not given.
+    etag : str
+        Current entity tag of the resource.
+
+    Returns
+    -------
+    match : bool
+        True if the client already holds the current representation.
+
+    """
+
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return any(tag == opaque for tag in re.findall(r'(?:W/)?("[^"]*")', header))
+
+
+def _zone_summary(zone):
+    """
+    Desk counts and latest closed rollups of a single zone.
+
+    """
+
+    return {
+        'path':        list(zone.path),
+        'n_desks':     zone.n_desks,
+        'n_occupied':  zone.n_occupied,
+        'hourly':      _finite(hlp.latest_closed(zone.hourly_occupancy_percentage)),
+        'daily':       _finite(hlp.latest_closed(zone.daily_occupancy_percentage)),
+    }
+
+
+class Snapshot():
+    """
+    Immutable, precomputed view of occupancy state.
+    Every route body is serialized once when the snapshot is built so that
+    requests only look up bytes and never touch the live Engine state.
+    Desks without new samples since the previous snapshot reuse its serialized bodies,
+    so building a snapshot costs in proportion to the desks that changed.
+
+    """
+
+    def __init__(self, engine, version, previous=None):
+        self.version = version
+
+        # device_id -> (desk version, summary, (body, etag)), unchanged desks taken from previous snapshot
+        cache = {} if previous is None else previous.desks
+        self.desks = {}
+        for device_id, desk in engine.desks.items():
+            key = _desk_version(desk)
+            if device_id in cache and cache[device_id][0] == key:
+                self.desks[device_id] = cache[device_id]
+                continue
+            summary  = _desk_summary(desk)
+            document = dict(summary, series=_desk_series(desk, params['server']['series_length']))
+            self.desks[device_id] = (key, summary, _serialize(document))
+
+        # route -> document
+        documents = {
+            '/desks':            {'desks': [summary for _, summary, _ in self.desks.values()]},
+            '/occupancy':        {
+                'hourly':     _finite(hlp.latest_closed(engine.hourly_occupancy_percentage)),
+                'daily':      _finite(hlp.latest_closed(engine.daily_occupancy_percentage)),
+                'duplicates': engine.dedup.suppressed,
+                'late':       engine.n_late,
+            },
+            '/occupancy/hourly': _rollup(engine.hourly_occupancy_timestamp, engine.hourly_occupancy_percentage),
+            '/occupancy/daily':  _rollup(engine.daily_occupancy_timestamp,  engine.daily_occupancy_percentage),
+            '/zones':            {'zones': [_zone_summary(zone) for zone in engine.zones.nodes.values()]},
+        }
+
+        # serialize once and tag with content hash
+        self.routes = {'/desks/' + device_id: entry for device_id, (_, _, entry) in self.desks.items()}
+        for route, document in documents.items():
+            self.routes[route] = _serialize(document)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serve GET requests from the currently published snapshot.
+
+    """
+
+    # keep-alive connections, headers and body are separate writes
+    protocol_version        = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        # grab reference once, a newer snapshot may be swapped in meanwhile
+        snapshot = self.server.snapshot
+        route = self.path.split('?')[0].rstrip('/')
+
+        if snapshot is None or route not in snapshot.routes:
+            self.__respond(404, b'{"error": "not found"}', None)
+            return
+
+        body, etag = snapshot.routes[route]
+
+        # conditional request
+        if _etag_matches(self.headers.get('If-None-Match'), etag):
+            self.__respond(304, b'', etag)
+        else:
+            self.__respond(200, body, etag)
+
+
+    def __respond(self, status, body, etag):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        # silence per-request console output
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    """
+    Threading server with a listen backlog for many clients connecting at once.
+
+    """
+
+    # default of 5 drops connections of bursts of clients, which then retry after a second
+    request_queue_size = 128
+
+
+class OccupancyServer():
+    """
+    Embedded HTTP/JSON server for live occupancy.
+    Runs in a daemon thread and serves the latest published Snapshot.
+    Ingestion publishes new snapshots by swapping a single reference,
+    so reads never wait for ingestion and ingestion never waits for reads.
+
+    """
+
+    def __init__(self, host, port):
+        # create server, no snapshot until first publish
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.snapshot = None
+        self.version = 0
+
+        # serve in background
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+
+    def publish(self, engine):
+        """
+        Build a new snapshot from current Engine state and swap it in.
+        Only desks with new samples since the last publish are serialized again.
+
+        Parameters
+        ----------
+        engine : Engine
+            Object holding desks and occupancy rollups.
+
+        """
+
+        self.version += 1
+        self.httpd.snapshot = Snapshot(engine, self.version, self.httpd.snapshot)
+
+
+    def shutdown(self):
+        """
+        Stop serving and release the socket.
+
+        """
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,271 @@
+# packages
+import os
+import time
+import struct
+import atexit
+import logging
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# project
+import occupancy.helpers as hlp
+
+# module logger
+logger = logging.getLogger(__name__)
+
+
+# fixed header layout:
+#   magic, sequence number, capacity, number of desks, publisher pid, publish unixtime,
+#   latest closed hourly- and daily occupancy and latest reference temperature
+HEADER_FORMAT = '<8sQIIIdddd'
+HEADER_SIZE   = struct.calcsize(HEADER_FORMAT)
+MAGIC         = b'DESKOCC2'
+
+# byte offset of the sequence number within header
+SEQ_OFFSET = 8
+
+# fixed width per-desk record
+RECORD_DTYPE = np.dtype([
+    ('id',          'S32'),
+    ('state',       'i1'),
+    ('unixtime',    '<i8'),
+    ('temperature', '<f8'),
+    ('diff',        '<f8'),
+])
+
+
+def _segment_size(capacity):
+    return HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+
+
+def _pid_alive(pid):
+    """
+    Return True if a process with this pid is running.
+
+    """
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but owned by another user
+        return True
+    return True
+
+
+def _nan_if_none(value):
+    return np.nan if value is None else value
+
+
+class SharedStatePublisher():
+    """
+    Writes a fixed-layout snapshot of occupancy state into shared memory.
+    Updates are guarded by a seqlock. The sequence number in the header is odd
+    while a write is in progress and incremented to even when it is done,
+    letting any number of readers detect and retry torn reads without locking.
+
+    """
+
+    def __init__(self, name, capacity):
+        # add to self
+        self.capacity = capacity
+        self.seq      = 0
+
+        # desks not fitting into segment and truncated identifiers already warned about
+        self.n_dropped = 0
+        self.truncated = set()
+
+        # create segment, replacing one left behind by a publisher that is no longer running
+        size = _segment_size(capacity)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self.__unlink_stale(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        # zero-copy view of records
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+
+        # write empty header
+        self.__write_header(0, 0, np.nan, np.nan, np.nan)
+
+        # release segment on exit
+        atexit.register(self.close)
+
+
+    @staticmethod
+    def __unlink_stale(name):
+        """
+        Remove an existing segment of the same name if its publisher is no longer running.
+        Raises FileExistsError if the segment is in use or is not an occupancy segment.
+
+        """
+
+        existing = shared_memory.SharedMemory(name=name)
+        try:
+            # the segment is not ours to remove at exit unless we unlink it below
+            resource_tracker.unregister(existing._name, 'shared_memory')
+            if existing.size < HEADER_SIZE:
+                raise FileExistsError('Shared memory segment {} exists and is not an occupancy segment.'.format(name))
+            magic, _, _, _, pid, _, _, _, _ = struct.unpack_from(HEADER_FORMAT, existing.buf, 0)
+            if magic != MAGIC:
+                raise FileExistsError('Shared memory segment {} exists and is not an occupancy segment.'.format(name))
+            if _pid_alive(pid):
+                raise FileExistsError('Shared memory segment {} is in use by publisher pid {}.'.format(name, pid))
+        finally:
+            existing.close()
+
+        logger.warning('Replacing shared memory segment %s left behind by publisher pid %d', name, pid)
+        resource_tracker.register(existing._name, 'shared_memory')
+        existing.unlink()
+
+
+    def __write_header(self, n_desks, unixtime, hourly, daily, reference):
+        struct.pack_into(HEADER_FORMAT, self.shm.buf, 0, MAGIC, self.seq, self.capacity, n_desks, os.getpid(), unixtime, hourly, daily, reference)
+
+
+    def publish(self, engine):
+        """
+        Write current Engine state into shared memory.
+
+        Parameters
+        ----------
+        engine : Engine
+            Object holding desks, reference and occupancy rollups.
+
+        """
+
+        desks = list(engine.desks.values())
+
+        # warn once per change in number of desks not fitting into segment
+        n_dropped = max(0, len(desks) - self.capacity)
+        if n_dropped != self.n_dropped:
+            self.n_dropped = n_dropped
+            if n_dropped > 0:
+                logger.warning('%d desks exceed shared memory capacity of %d and are not published', n_dropped, self.capacity, extra={'dropped': n_dropped})
+        desks = desks[:self.capacity]
+
+        # identifiers longer than the record field are truncated, warn once per desk
+        for desk in desks:
+            if desk.device_id not in self.truncated and len(desk.device_id.encode('utf-8')) > RECORD_DTYPE['id'].itemsize:
+                self.truncated.add(desk.device_id)
+                logger.warning('Desk id %s is truncated to %d bytes in shared memory', desk.device_id, RECORD_DTYPE['id'].itemsize)
+
+        # mark write in progress
+        self.seq += 1
+        struct.pack_into('<Q', self.shm.buf, SEQ_OFFSET, self.seq)
+
+        # per-desk records
+        for i, desk in enumerate(desks):
+            if len(desk.unixtime) > 0:
+                self.records[i] = (desk.device_id, desk.state[-1], desk.unixtime[-1], desk.temperature[-1], desk.diff[-1])
+            else:
+                self.records[i] = (desk.device_id, 0, 0, np.nan, np.nan)
+
+        # rollups
+        self.__write_header(
+            len(desks),
+            time.time(),
+            _nan_if_none(hlp.latest_closed(engine.hourly_occupancy_percentage)),
+            _nan_if_none(hlp.latest_closed(engine.daily_occupancy_percentage)),
+            engine.reference.latest_value,
+        )
+
+        # mark write completed
+        self.seq += 1
+        struct.pack_into('<Q', self.shm.buf, SEQ_OFFSET, self.seq)
+
+
+    def close(self):
+        """
+        Detach from and remove the shared memory segment.
+
+        """
+
+        if self.shm is None:
+            return
+        self.records = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            # already removed by someone else
+            pass
+        self.shm = None
+
+
+class SharedStateReader():
+    """
+    Attaches to a segment written by SharedStatePublisher.
+    Reading never blocks the publisher and causes no API traffic.
+
+    """
+
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name=name)
+
+        # the publisher owns the segment, do not unlink it when this process exits
+        resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        # verify layout
+        magic, _, capacity, _, _, _, _, _, _ = struct.unpack_from(HEADER_FORMAT, self.shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError('Shared memory segment {} is not an occupancy segment.'.format(name))
+
+        # zero-copy view of records
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+
+
+    def read(self, timeout=1.0):
+        """
+        Read a consistent snapshot of the published state.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to keep retrying torn reads before giving up.
+
+        Returns
+        -------
+        header : dictionary
+            Publish time, rollups and reference temperature.
+        records : ndarray
+            Structured array with one record per desk.
+
+        """
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            # sequence before read, odd means write in progress
+            seq = struct.unpack_from('<Q', self.shm.buf, SEQ_OFFSET)[0]
+            if seq % 2 == 0:
+                # copy out state
+                _, _, _, n_desks, _, unixtime, hourly, daily, reference = struct.unpack_from(HEADER_FORMAT, self.shm.buf, 0)
+                records = self.records[:n_desks].copy()
+
+                # accept if no write happened meanwhile
+                if struct.unpack_from('<Q', self.shm.buf, SEQ_OFFSET)[0] == seq:
+                    header = {
+                        'version':   seq // 2,
+                        'unixtime':  unixtime,
+                        'hourly':    hourly,
+                        'daily':     daily,
+                        'reference': reference,
+                    }
+                    return header, records
+
+            # let the publisher finish
+            time.sleep(0)
+
+        raise TimeoutError('Could not read consistent occupancy state.')
+
+
+    def close(self):
+        """
+        Detach from the shared memory segment.
+
+        """
+
+        self.records = None
+        self.shm.close()
@@ -0,0 +1,373 @@
+# packages
+import pandas as pd
+
+# project
+from occupancy           import helpers
+from occupancy.reference import Reference
+from config.parameters   import params as default_params
+
+
+class Zone():
+    """
+    One node in the desk -> zone -> floor -> building hierarchy.
+    Keeps running counts of desks in its subtree so that occupancy of
+    any zone is available without iterating desks.
+
+    """
+
+    def __init__(self, path, args, params=None):
+        # add to self
+        self.path     = path
+        self.children = {}
+        self.params   = default_params if params is None else params
+
+        # running counts for subtree
+        self.n_desks    = 0   # desks in subtree
+        self.n_occupied = 0   # desks currently in occupied state
+        self.n_active   = {}  # open hour unixtime -> desks occupied at some point in that hour
+
+        # zone level reference sensors
+        self.reference = Reference(args)
+
+        # occupancy lists
+        self.hourly_occupancy_timestamp  = []
+        self.hourly_occupancy_percentage = []
+        self.daily_occupancy_timestamp   = []
+        self.daily_occupancy_percentage  = []
+
+
+    def open_hour(self, timestamp_hour, hour):
+        self.hourly_occupancy_timestamp.append(timestamp_hour)
+        self.hourly_occupancy_percentage.append(None)
+        self.n_active[hour] = 0
+
+
+    def open_day(self, timestamp_day):
+        self.daily_occupancy_timestamp.append(timestamp_day + pd.Timedelta('12h'))
+        self.daily_occupancy_percentage.append(None)
+
+
+    def close_hour(self, timestamp_hour, hour):
+        """
+        Set percentage of desks active during the hour and drop its activity count.
+
+        Parameters
+        ----------
+        timestamp_hour : datetime
+            Start of hour in pandas datetime format.
+        hour : int
+            Start of hour as unixtime.
+
+        """
+
+        n_active = self.n_active.pop(hour, 0)
+        i = helpers.last_index(self.hourly_occupancy_timestamp, timestamp_hour)
+        if i is not None and self.n_desks > 0:
+            self.hourly_occupancy_percentage[i] = (n_active / self.n_desks) * 100
+
+
+    def close_day(self, timestamp_day):
+        """
+        Set daily percentage as median of hourly percentages within working hours.
+
+        Parameters
+        ----------
+        timestamp_day : datetime
+            Start of day in pandas datetime format.
+
+        """
+
+        i = helpers.last_index(self.daily_occupancy_timestamp, timestamp_day + pd.Timedelta('12h'))
+        if i is not None:
+            self.daily_occupancy_percentage[i] = helpers.working_hours_median(
+                self.hourly_occupancy_timestamp,
+                self.hourly_occupancy_percentage,
+                timestamp_day,
+                self.params['occupancy']['working_hours'],
+            )
+
+
+    def occupied_percentage(self):
+        """
+        Return percentage of desks in subtree currently occupied.
+
+        """
+
+        if self.n_desks == 0:
+            return None
+        return (self.n_occupied / self.n_desks) * 100
+
+
+class ZoneTree():
+    """
+    Hierarchy of zones built from device labels.
+    The label keys in params['zones']['label_keys'] are read in order, each giving
+    one level below the project root. A desk belongs to the deepest zone for which
+    all label keys up to that level are set. Counts are updated incrementally on
+    every desk update along the path from the desk to the root, O(depth).
+
+    """
+
+    def __init__(self, args, label_keys=None, params=None):
+        # add to self
+        self.args       = args
+        self.params     = default_params if params is None else params
+        self.label_keys = self.params['zones']['label_keys'] if label_keys is None else label_keys
+
+        # path tuple -> Zone, root is the empty path
+        self.root  = Zone((), args, self.params)
+        self.nodes = {(): self.root}
+
+        # device_id -> path of zone holding device
+        self.desk_paths      = {}
+        self.reference_paths = {}
+
+        # desks currently occupied, and desks active per open hour
+        self.occupied = set()
+        self.active   = {}
+
+        # currently open buckets, unixtime -> pandas timestamp of bucket start
+        self.open_hours = {}
+        self.open_days  = {}
+
+
+    def device_path(self, device):
+        """
+        Return zone path of device from its labels.
+
+        Parameters
+        ----------
+        device : dictionary
+            Device information json in dictionary format.
+
+        Returns
+        -------
+        path : tuple
+            Label values from top level down, stopping at first missing key.
+
+        """
+
+        path = []
+        for key in self.label_keys:
+            if key not in device['labels']:
+                break
+            path.append(device['labels'][key])
+        return tuple(path)
+
+
+    def __ancestors(self, path):
+        # zones from deepest to root
+        return [self.nodes[path[:i]] for i in range(len(path), -1, -1)]
+
+
+    def __get_or_create(self, path):
+        # create missing zones along path
+        for i in range(1, len(path)+1):
+            if path[:i] not in self.nodes:
+                zone = Zone(path[:i], self.args, self.params)
+                for hour, timestamp_hour in self.open_hours.items():
+                    zone.open_hour(timestamp_hour, hour)
+                for timestamp_day in self.open_days.values():
+                    zone.open_day(timestamp_day)
+                self.nodes[path[:i-1]].children[path[i-1]] = zone
+                self.nodes[path[:i]] = zone
+        return self.nodes[path]
+
+
+    def add_desk(self, device_id, device):
+        """
+        Place desk in hierarchy.
+
+        Parameters
+        ----------
+        device_id : str
+            Device identifier.
+        device : dictionary
+            Device information json in dictionary format.
+
+        """
+
+        path = self.device_path(device)
+        self.__get_or_create(path)
+        self.desk_paths[device_id] = path
+        for zone in self.__ancestors(path):
+            zone.n_desks += 1
+
+
+    def remove_desk(self, device_id):
+        """
+        Remove desk and its contribution to counts.
+
+        Parameters
+        ----------
+        device_id : str
+            Device identifier.
+
+        """
+
+        path = self.desk_paths.pop(device_id)
+        for zone in self.__ancestors(path):
+            zone.n_desks    -= 1
+            zone.n_occupied -= device_id in self.occupied
+            for hour, active in self.active.items():
+                zone.n_active[hour] -= device_id in active
+        self.occupied.discard(device_id)
+        for active in self.active.values():
+            active.discard(device_id)
+
+
+    def add_reference(self, device_id, device):
+        """
+        Add reference sensor to the Reference of its zone.
+        References without zone labels belong to the project and are not added here.
+
+        Parameters
+        ----------
+        device_id : str
+            Device identifier.
+        device : dictionary
+            Device information json in dictionary format.
+
+        """
+
+        path = self.device_path(device)
+        if len(path) == 0:
+            return
+
+        # own copy as Reference stores its series in the device dictionary
+        self.__get_or_create(path).reference.add_device(dict(device), device_id)
+        self.reference_paths[device_id] = path
+
+
+    def remove_reference(self, device_id):
+        """
+        Remove reference sensor from its zone, if any.
+
+        Parameters
+        ----------
+        device_id : str
+            Device identifier.
+
+        """
+
+        if device_id in self.reference_paths:
+            self.nodes[self.reference_paths.pop(device_id)].reference.remove_device(device_id)
+
+
+    def new_reference_event(self, event_data, device_id, timestamp=None, unixtime=None):
+        """
+        Serve reference event to zone reference, if any.
+
+        Parameters
+        ----------
+        event_data : dictionary
+            Data json containing new event data.
+        device_id : str
+            Identifier of source device.
+        timestamp : datetime
+            Already parsed event timestamp, parsed from event_data if None.
+        unixtime : int
+            Already parsed event unixtime, parsed from event_data if None.
+
+        """
+
+        if device_id in self.reference_paths:
+            self.nodes[self.reference_paths[device_id]].reference.new_event_data(event_data, device_id, timestamp, unixtime)
+
+
+    def reference_value(self, device_id, default):
+        """
+        Return latest reference value of nearest zone above desk with a reporting reference sensor.
+
+        Parameters
+        ----------
+        device_id : str
+            Desk device identifier.
+        default : float
+            Project wide reference value used if no zone has a reference.
+
+        Returns
+        -------
+        value : float
+            Latest reference temperature value.
+
+        """
+
+        for zone in self.__ancestors(self.desk_paths[device_id])[:-1]:
+            if len(zone.reference.temperature) > 0:
+                return zone.reference.latest_value
+        return default
+
+
+    def update_desk(self, desk, hour=None, count=True):
+        """
+        Update counts after desk has received new event data.
+
+        Parameters
+        ----------
+        desk : Desk
+            Desk that was just iterated.
+        hour : int
+            Unixtime of hour bucket the event belongs to, hour of last desk sample if None.
+            Activity is not counted if the bucket is not open.
+        count : bool
+            Count activity in hour bucket, only the occupied count is updated if False.
+
+        """
+
+        if len(desk.state) == 0:
+            return
+        device_id = desk.device_id
+        occupied  = desk.state[-1] == 1
+
+        # state swap
+        if occupied != (device_id in self.occupied):
+            for zone in self.__ancestors(self.desk_paths[device_id]):
+                zone.n_occupied += 1 if occupied else -1
+            if occupied:
+                self.occupied.add(device_id)
+            else:
+                self.occupied.discard(device_id)
+
+        # first occupied sample within an open hour
+        if hour is None:
+            hour = desk.unixtime[-1] - desk.unixtime[-1] % 3600
+        if count and occupied and hour in self.active and device_id not in self.active[hour]:
+            for zone in self.__ancestors(self.desk_paths[device_id]):
+                zone.n_active[hour] += 1
+            self.active[hour].add(device_id)
+
+
+    def open_hour(self, timestamp_hour, hour):
+        self.open_hours[hour] = timestamp_hour
+        self.active[hour] = set()
+        for zone in self.nodes.values():
+            zone.open_hour(timestamp_hour, hour)
+
+
+    def open_day(self, timestamp_day, day):
+        self.open_days[day] = timestamp_day
+        for zone in self.nodes.values():
+            zone.open_day(timestamp_day)
+
+
+    def close_hour(self, hour):
+        timestamp_hour = self.open_hours.pop(hour)
+        for zone in self.nodes.values():
+            zone.close_hour(timestamp_hour, hour)
+        del self.active[hour]
+
+
+    def close_day(self, day):
+        timestamp_day = self.open_days.pop(day)
+        for zone in self.nodes.values():
+            zone.close_day(timestamp_day)
+
+
+    def zone(self, path):
+        """
+        Return zone at path, for example ('building-a', '3') for floor 3 of building-a.
+
+        """
+
+        return self.nodes[tuple(path)]
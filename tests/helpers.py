@@ -0,0 +1,21 @@
+# packages
+import copy
+
+# project
+from occupancy.desk    import Desk
+from config.parameters import params as default_params
+
+
+def make_params(mode, lookback=60*60, retain=None):
+    params = copy.deepcopy(default_params)
+    params['diff']['threshold_mode']       = mode
+    params['diff']['longest_avg_lookback'] = lookback
+    params['diff']['retain']               = retain
+    return params
+
+
+def per_sample(unixtime, diff, params):
+    desk = Desk(None, 'test', None, params)
+    for t, d in zip(unixtime, diff):
+        desk.append_sample(None, t, d, d)
+    return desk
@@ -0,0 +1,84 @@
+# packages
+import numpy  as np
+import pytest
+
+# project
+from benchmarks.synthetic import make_series
+from occupancy.desk       import Desk
+from tests.helpers        import make_params, per_sample
+
+
+def test_window_equals_run_when_lookback_covers_runs():
+    unixtime, diff = make_series(5000, seed=1)
+    run    = per_sample(unixtime, diff, make_params('run'))
+    window = per_sample(unixtime, diff, make_params('window', lookback=10**9))
+
+    assert window.state == run.state
+    np.testing.assert_allclose(window.dsl_thrs, run.dsl_thrs, rtol=1e-9, equal_nan=True)
+
+
+def test_window_threshold_is_mean_over_lookback():
+    lookback = 30*60
+    unixtime, diff = make_series(5000, seed=2, decay=0.995)
+    desk = per_sample(unixtime, diff, make_params('window', lookback=lookback))
+
+    # brute force mean over the occupied samples of the run within lookback
+    n_checked = 0
+    run_start = None
+    for i in range(1, len(desk.state)):
+        if desk.state[i] == 1 and desk.state[i-1] == 0:
+            run_start = i
+        if desk.state[i] == 1 and i > run_start:
+            window = [diff[j] for j in range(run_start, i+1) if unixtime[j] >= unixtime[i] - lookback]
+            assert desk.dsl_thrs[i] == pytest.approx(np.mean(window), rel=1e-9)
+            n_checked += 1
+    assert n_checked > 100
+
+
+def test_window_detects_run_end_that_run_mode_misses():
+    # a long mild run that warms up and then drops back part of the way, the whole-run mean
+    # is held down by the mild hours and misses the drop, the recent-window mean catches it
+    unixtime = [1600000000 + 300*i for i in range(140)]
+    diff = [0.0]*10 + [2.0]*60 + [5.0]*10 + [3.5]*30 + [0.0]*30
+
+    run    = per_sample(unixtime, diff, make_params('run'))
+    window = per_sample(unixtime, diff, make_params('window', lookback=30*60))
+
+    assert run.state[80:110]    == [1]*30
+    assert window.state[80:110] == [0]*30
+    assert run.state[:80] == window.state[:80]
+
+
+def test_window_eviction_is_bounded():
+    # one occupied run over a week, the window never holds more than lookback of samples
+    lookback, period = 60*60, 300
+    params = make_params('window', lookback=lookback)
+    desk = Desk(None, 'test', None, params)
+    desk.append_sample(None, 1600000000, 0.0, 0.0)
+    for i in range(1, 7*24*12):
+        desk.append_sample(None, 1600000000 + period*i, 5.0, 5.0)
+        assert len(desk.window) <= lookback // period + 1
+
+    assert desk.state_flag
+    assert desk.window_sum == pytest.approx(sum(d for _, d in desk.window))
+    assert desk.window[0][0] >= desk.unixtime[-1] - lookback
+
+
+@pytest.mark.parametrize('mode', ['run', 'window'])
+def test_retain_preserves_tail(mode):
+    retain = 24*60*60
+    unixtime, diff = make_series(20000, seed=3)
+    full    = per_sample(unixtime, diff, make_params(mode))
+    trimmed = per_sample(unixtime, diff, make_params(mode, retain=retain))
+
+    # memory is bounded, the current run is kept whole in run mode only
+    assert trimmed.n_trimmed > 0
+    assert len(trimmed.unixtime) + trimmed.n_trimmed == len(full.unixtime)
+    if mode == 'window':
+        assert trimmed.unixtime[-1] - trimmed.unixtime[0] <= 2*retain
+
+    m = len(trimmed.unixtime)
+    assert trimmed.unixtime == full.unixtime[-m:]
+    assert trimmed.state    == full.state[-m:]
+    np.testing.assert_allclose(trimmed.roc_thrs, full.roc_thrs[-m:])
+    np.testing.assert_allclose(trimmed.dsl_thrs, full.dsl_thrs[-m:], equal_nan=True)
@@ -0,0 +1,103 @@
+# packages
+import numpy  as np
+import pytest
+
+# project
+from benchmarks.synthetic import make_series
+from occupancy            import kernel
+from occupancy.desk       import Desk
+from tests.helpers        import make_params, per_sample
+
+
+# numba is optional, its case only runs where it is installed
+BACKENDS = ['python', pytest.param('numba', marks=pytest.mark.skipif('numba' not in kernel.KERNELS, reason='numba not installed'))]
+MODES    = ['run', 'window']
+
+
+
+def assert_same_series(desk, expected):
+    # compare the samples both hold, trimming drops the oldest ones
+    m = min(len(desk.unixtime), len(expected.unixtime))
+    assert desk.unixtime[-m:] == expected.unixtime[-m:]
+    assert list(desk.state[-m:]) == list(expected.state[-m:])
+    np.testing.assert_allclose(desk.roc[-m:],      expected.roc[-m:])
+    np.testing.assert_allclose(desk.roc_thrs[-m:], expected.roc_thrs[-m:])
+    np.testing.assert_allclose(desk.dsl_thrs[-m:], expected.dsl_thrs[-m:], rtol=1e-9, equal_nan=True)
+    assert desk.state_flag == expected.state_flag
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('mode', MODES)
+def test_estimate_matches_desk(backend, mode):
+    params = make_params(mode)
+    unixtime, diff = make_series(10000, seed=1)
+    expected = per_sample(unixtime, diff, params)
+    series = kernel.estimate(unixtime, diff, backend=backend, params=params)
+
+    assert series['state'].tolist() == expected.state
+    np.testing.assert_allclose(series['roc'],      expected.roc)
+    np.testing.assert_allclose(series['roc_thrs'], expected.roc_thrs)
+    np.testing.assert_allclose(series['dsl_thrs'], expected.dsl_thrs, rtol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('mode', MODES)
+def test_run_continues_from_history(backend, mode):
+    params = make_params(mode)
+    unixtime, diff = make_series(5000, seed=2)
+    full = kernel.estimate(unixtime, diff, backend=backend, params=params)
+
+    # second half computed on top of the first half only, padded with the initial values
+    half  = len(unixtime) // 2
+    first = kernel.estimate(unixtime[:half], diff[:half], backend=backend, params=params)
+    pad   = kernel.estimate(unixtime[half:], diff[half:], backend=backend, params=params)
+    series = {key: np.concatenate([first[key], np.full_like(pad[key], pad[key][0])]) for key in first}
+    flag = bool(first['state'][-1])
+    run_start = half - 1
+    while flag and run_start > 0 and first['state'][run_start-1] == 1:
+        run_start -= 1
+    kernel.run(
+        np.array(unixtime), np.array(diff), series['roc'], series['roc_thrs'], series['dsl_thrs'], series['state'],
+        start=half, state_flag=flag, run_start=run_start, backend=backend, params=params,
+    )
+
+    assert series['state'].tolist() == full['state'].tolist()
+    np.testing.assert_allclose(series['dsl_thrs'], full['dsl_thrs'], rtol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('retain', [None, 24*60*60])
+@pytest.mark.parametrize('mode', MODES)
+def test_append_samples_matches_desk(backend, mode, retain):
+    params = make_params(mode, retain=retain)
+    unixtime, diff = make_series(20000, seed=3)
+    expected = per_sample(unixtime, diff, params)
+
+    # whole series at once
+    bulk = Desk(None, 'test', None, params)
+    bulk.append_samples([None]*len(unixtime), unixtime, diff, diff, backend=backend)
+    assert_same_series(bulk, expected)
+
+    # uneven blocks mixed with single samples, continuing in and out of occupied runs
+    mixed = Desk(None, 'test', None, params)
+    rng = np.random.default_rng(3)
+    i = 0
+    while i < len(unixtime):
+        j = min(len(unixtime), i + int(rng.integers(1, 500)))
+        if rng.random() < 0.3:
+            for k in range(i, j):
+                mixed.append_sample(None, unixtime[k], diff[k], diff[k])
+        else:
+            mixed.append_samples([None]*(j-i), unixtime[i:j], diff[i:j], diff[i:j], backend=backend)
+        i = j
+    assert_same_series(mixed, expected)
+    if retain is None:
+        assert len(mixed.unixtime) == len(expected.unixtime)
+        assert mixed.state_start_index == expected.state_start_index or not expected.state_flag
+
+
+def test_backend_name():
+    assert kernel.backend_name('python') == 'python'
+    assert kernel.backend_name('auto') == ('numba' if 'numba' in kernel.KERNELS else 'python')
+    with pytest.raises(ValueError):
+        kernel.backend_name('fortran')